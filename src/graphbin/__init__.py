@@ -164,6 +164,146 @@ def main():
         print("\nExiting GraphBin...\nBye...!\n")
         sys.exit(1)
 
+    # Validate lp_workers
+    if args.lp_workers < 0:
+        print("\nPlease enter a valid number for lp_workers")
+
+        print("\nExiting GraphBin...\nBye...!\n")
+        sys.exit(1)
+
+    # Validate sparse_scores and top_k
+    if args.sparse_scores and args.lp_engine != "dict":
+        print("\nsparse_scores is only supported by the dict label propagation engine")
+
+        print("\nExiting GraphBin...\nBye...!\n")
+        sys.exit(1)
+
+    # Validate lp_precision
+    if args.lp_precision != "float64" and args.lp_engine != "sparse":
+        print("\nlp_precision is only supported by the sparse label propagation engine")
+
+        print("\nExiting GraphBin...\nBye...!\n")
+        sys.exit(1)
+
+    # Validate lp_solver
+    if args.lp_solver != "iterate" and (
+        args.lp_engine != "sparse" or args.lp_precision != "float64"
+    ):
+        print("\nlp_solver is only supported by the sparse engine with float64 scores")
+
+        print("\nExiting GraphBin...\nBye...!\n")
+        sys.exit(1)
+
+    # Validate threads
+    if args.threads <= 0:
+        print("\nPlease enter a valid number for threads")
+
+        print("\nExiting GraphBin...\nBye...!\n")
+        sys.exit(1)
+
+    if args.threads > 1 and (
+        args.lp_engine != "sparse" or args.frontier_tol is not None
+    ):
+        print("\nthreads is only supported by the sparse engine without frontier_tol")
+
+        print("\nExiting GraphBin...\nBye...!\n")
+        sys.exit(1)
+
+    # Validate freeze_tol and freeze_iterations
+    if args.freeze_tol is not None and (
+        args.freeze_tol < 0 or args.freeze_iterations <= 0
+    ):
+        print("\nPlease enter valid numbers for freeze_tol and freeze_iterations")
+
+        print("\nExiting GraphBin...\nBye...!\n")
+        sys.exit(1)
+
+    if args.freeze_tol is not None and (
+        args.frontier_tol is not None
+        or args.sparse_scores
+        or args.acceleration is not None
+        or args.threads > 1
+    ):
+        print(
+            "\nfreeze_tol cannot be used together with frontier_tol, sparse_scores, acceleration or threads"
+        )
+
+        print("\nExiting GraphBin...\nBye...!\n")
+        sys.exit(1)
+
+    if args.top_k is not None and (not args.sparse_scores or args.top_k <= 0):
+        print("\nPlease enter a valid number for top_k together with sparse_scores")
+
+        print("\nExiting GraphBin...\nBye...!\n")
+        sys.exit(1)
+
+    # Validate acceleration
+    if args.acceleration is not None and (
+        args.frontier_tol is not None or args.sparse_scores
+    ):
+        print("\nacceleration cannot be used together with frontier_tol or sparse_scores")
+
+        print("\nExiting GraphBin...\nBye...!\n")
+        sys.exit(1)
+
+    if args.acceleration_depth <= 0:
+        print("\nPlease enter a valid number for acceleration_depth")
+
+        print("\nExiting GraphBin...\nBye...!\n")
+        sys.exit(1)
+
+    # Validate checkpoint_iterations, checkpoint_seconds and resume
+    if args.checkpoint_iterations is not None and args.checkpoint_iterations <= 0:
+        print("\nPlease enter a valid number for checkpoint_iterations")
+
+        print("\nExiting GraphBin...\nBye...!\n")
+        sys.exit(1)
+
+    if args.checkpoint_seconds is not None and args.checkpoint_seconds <= 0:
+        print("\nPlease enter a valid number for checkpoint_seconds")
+
+        print("\nExiting GraphBin...\nBye...!\n")
+        sys.exit(1)
+
+    if args.lp_workers and (
+        args.checkpoint_iterations is not None
+        or args.checkpoint_seconds is not None
+        or args.resume
+        or args.save_scores
+        or args.warm_start is not None
+    ):
+        print("\nSaved label scores are not supported together with lp_workers")
+
+        print("\nExiting GraphBin...\nBye...!\n")
+        sys.exit(1)
+
+    # the history of the accelerated iterations is not saved in checkpoints
+    if args.resume and args.acceleration is not None:
+        print("\nresume cannot be used together with acceleration")
+
+        print("\nExiting GraphBin...\nBye...!\n")
+        sys.exit(1)
+
+    if args.lp_workers and args.compress_chains:
+        print("\ncompress_chains cannot be used together with lp_workers")
+
+        print("\nExiting GraphBin...\nBye...!\n")
+        sys.exit(1)
+
+    # Validate max_hops
+    if args.max_hops is not None and args.max_hops <= 0:
+        print("\nPlease enter a valid number for max_hops")
+
+        print("\nExiting GraphBin...\nBye...!\n")
+        sys.exit(1)
+
+    # Validate warm_start
+    if args.warm_start is not None and not os.path.isfile(args.warm_start):
+        print("\nFailed to open the saved label scores file.")
+
+        print("\nExiting GraphBin...\nBye...!\n")
+        sys.exit(1)
+
     # Remove previous files if they exist
     if os.path.exists(args.output + args.prefix + "graphbin.log"):
         os.remove(args.output + args.prefix + "graphbin.log")
@@ -171,6 +311,10 @@ def main():
         os.remove(args.output + args.prefix + "graphbin_output.csv")
     if os.path.exists(args.output + args.prefix + "graphbin_unbinned.csv"):
         os.remove(args.output + args.prefix + "graphbin_unbinned.csv")
+    if os.path.exists(args.output + args.prefix + "graphbin_lp_metrics.csv"):
+        os.remove(args.output + args.prefix + "graphbin_lp_metrics.csv")
+    if os.path.exists(args.output + args.prefix + "graphbin_lp_metrics.json"):
+        os.remove(args.output + args.prefix + "graphbin_lp_metrics.json")
 
     # Run GraphBin
     # ---------------------------------------------------
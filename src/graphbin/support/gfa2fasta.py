@@ -13,6 +13,9 @@ import sys
 
 from cogent3 import make_unaligned_seqs
 
+from graphbin.utils.gfareader.gfareader import read_records
+
+
 __author__ = "Vijini Mallawaarachchi"
 __copyright__ = "Copyright 2019, GraphBin Project"
 __credits__ = ["Vijini Mallawaarachchi", "Anuradha Wickramarachchi", "Yu Lin"]
@@ -104,18 +107,11 @@ except:
 print("\nObtaining edge sequences")
 
 sequences = {}
-with open(assembly_graph_file) as file:
-
-    for line in file.readlines():
-        line = line.strip()
-
-        if line.startswith("S"):
-
-            strings = line.split("\t")
+for strings in read_records(assembly_graph_file, ("S",)):
 
-            print(strings)
+    print(strings)
 
-            sequences[str(strings[1])] = re.sub("[^GATC]", "", str(strings[2]).upper())
+    sequences[str(strings[1])] = re.sub("[^GATC]", "", str(strings[2]).upper())
 
 print("\nWriting edge sequences to FASTA file")
 
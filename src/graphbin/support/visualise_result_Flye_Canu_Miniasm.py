@@ -19,6 +19,9 @@ import sys
 from bidirectionalmap.bidirectionalmap import BidirectionalMap
 from igraph import *
 
+from graphbin.utils.gfareader.gfareader import read_links
+
+
 __author__ = "Vijini Mallawaarachchi"
 __copyright__ = "Copyright 2019-2022, GraphBin Project"
 __credits__ = ["Vijini Mallawaarachchi", "Anuradha Wickramarachchi", "Yu Lin"]
@@ -204,35 +207,15 @@ node_count = 0
 
 nodes = []
 
-links = []
-
 try:
     # Get contig connections from .gfa file
-    with open(assembly_graph_file) as file:
-
-        for line in file.readlines():
-            line = line.strip()
+    gfa_links = read_links(assembly_graph_file)
 
-            # Count the number of contigs
-            if line.startswith("S"):
-                strings = line.split("\t")
-                my_node = strings[1]
-                my_map[node_count] = my_node
-                nodes.append(my_node)
-                node_count += 1
-
-            # Identify lines with link information
-            elif line.startswith("L"):
-
-                link = []
-                strings = line.split("\t")
-
-                if strings[1] != strings[3]:
-                    start = strings[1]
-                    end = strings[3]
-                    link.append(start)
-                    link.append(end)
-                    links.append(link)
+    # Count the number of contigs
+    for my_node in gfa_links.segments:
+        my_map[node_count] = my_node
+        nodes.append(my_node)
+        node_count += 1
 
 
 except:
@@ -261,11 +244,11 @@ try:
         assembly_graph.vs[i]["id"] = i
         assembly_graph.vs[i]["label"] = str(contigs_map[i])
 
-    # Iterate links
-    for link in links:
-        # Remove self loops
-        if link[0] != link[1]:
-            assembly_graph.add_edge(contigs_map_rev[link[0]], contigs_map_rev[link[1]])
+    # Iterate links, segments are numbered as their contigs
+    not_loop = gfa_links.src != gfa_links.dest
+    assembly_graph.add_edges(
+        list(zip(gfa_links.src[not_loop].tolist(), gfa_links.dest[not_loop].tolist()))
+    )
 
     assembly_graph.simplify(multiple=True, loops=False, combine_edges=None)
 
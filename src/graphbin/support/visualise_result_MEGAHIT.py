@@ -21,6 +21,9 @@ from bidirectionalmap.bidirectionalmap import BidirectionalMap
 from cogent3.parse.fasta import MinimalFastaParser
 from igraph import *
 
+from graphbin.utils.gfareader.gfareader import read_records
+
+
 __author__ = "Vijini Mallawaarachchi"
 __copyright__ = "Copyright 2019-2022, GraphBin Project"
 __credits__ = ["Vijini Mallawaarachchi", "Anuradha Wickramarachchi", "Yu Lin"]
@@ -233,50 +236,37 @@ my_map = BidirectionalMap()
 try:
 
     # Get links from .gfa file
-    with open(assembly_graph_file) as file:
-
-        for line in file.readlines():
-            line = line.strip()
-
-            # Identify lines with link information
-            if line.startswith("L"):
-                link = []
-
-                strings = line.split("\t")
+    for strings in read_records(assembly_graph_file, ("L", "S")):
 
-                start_1 = "NODE_"
-                end_1 = "_length"
+        # Identify lines with link information
+        if strings[0] == "L":
+            link = []
 
-                link1 = int(
-                    re.search("%s(.*)%s" % (start_1, end_1), strings[1]).group(1)
-                )
+            start_1 = "NODE_"
+            end_1 = "_length"
 
-                start_2 = "NODE_"
-                end_2 = "_length"
+            link1 = int(re.search("%s(.*)%s" % (start_1, end_1), strings[1]).group(1))
 
-                link2 = int(
-                    re.search("%s(.*)%s" % (start_2, end_2), strings[3]).group(1)
-                )
+            start_2 = "NODE_"
+            end_2 = "_length"
 
-                link.append(link1)
-                link.append(link2)
-                links.append(link)
+            link2 = int(re.search("%s(.*)%s" % (start_2, end_2), strings[3]).group(1))
 
-            elif line.startswith("S"):
-                strings = line.split()
+            link.append(link1)
+            link.append(link2)
+            links.append(link)
 
-                start = "NODE_"
-                end = "_length"
+        elif strings[0] == "S":
+            start = "NODE_"
+            end = "_length"
 
-                contig_num = int(
-                    re.search("%s(.*)%s" % (start, end), strings[1]).group(1)
-                )
+            contig_num = int(re.search("%s(.*)%s" % (start, end), strings[1]).group(1))
 
-                my_map[node_count] = int(contig_num)
+            my_map[node_count] = int(contig_num)
 
-                graph_contigs[contig_num] = strings[2]
+            graph_contigs[contig_num] = strings[2]
 
-                node_count += 1
+            node_count += 1
 
     print("\nTotal number of contigs available:", node_count)
 
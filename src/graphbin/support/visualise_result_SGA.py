@@ -20,6 +20,9 @@ import sys
 from bidirectionalmap.bidirectionalmap import BidirectionalMap
 from igraph import *
 
+from graphbin.utils.gfareader.gfareader import read_records
+
+
 __author__ = "Vijini Mallawaarachchi"
 __copyright__ = "Copyright 2019-2022, GraphBin Project"
 __credits__ = ["Vijini Mallawaarachchi", "Anuradha Wickramarachchi", "Yu Lin"]
@@ -205,27 +208,25 @@ my_map = BidirectionalMap()
 
 try:
     # Get contig connections from .asqg file
-    with open(assembly_graph_file) as file:
-        for line in file.readlines():
-            line = line.strip()
-
-            # Count the number of contigs
-            if line.startswith("VT"):
-                start = "contig-"
-                end = ""
-                contig_num = int(
-                    re.search("%s(.*)%s" % (start, end), str(line.split()[1])).group(1)
-                )
-                my_map[n_contigs] = contig_num
-                n_contigs += 1
-
-            # Identify lines with link information
-            elif line.startswith("ED"):
-                link = []
-                strings = line.split("\t")[1].split()
-                link.append(int(strings[0][7:]))
-                link.append(int(strings[1][7:]))
-                links.append(link)
+    for strings in read_records(assembly_graph_file, ("VT", "ED")):
+
+        # Count the number of contigs
+        if strings[0] == "VT":
+            start = "contig-"
+            end = ""
+            contig_num = int(
+                re.search("%s(.*)%s" % (start, end), str(strings[1])).group(1)
+            )
+            my_map[n_contigs] = contig_num
+            n_contigs += 1
+
+        # Identify lines with link information
+        elif strings[0] == "ED":
+            link = []
+            strings = strings[1].split()
+            link.append(int(strings[0][7:]))
+            link.append(int(strings[1][7:]))
+            links.append(link)
 
 except:
     print(
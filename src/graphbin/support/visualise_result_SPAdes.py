@@ -17,9 +17,14 @@ import re
 import subprocess
 import sys
 
+from collections import defaultdict
+
 from bidirectionalmap.bidirectionalmap import BidirectionalMap
 from igraph import *
 
+from graphbin.utils.gfareader.gfareader import read_links
+
+
 __author__ = "Vijini Mallawaarachchi"
 __copyright__ = "Copyright 2019-2022, GraphBin Project"
 __credits__ = ["Vijini Mallawaarachchi", "Anuradha Wickramarachchi", "Yu Lin"]
@@ -260,22 +265,24 @@ print("\nTotal number of contigs available:", node_count)
 ## Construct the assembly graph
 # -------------------------------
 
-links = []
 links_map = defaultdict(set)
 
 try:
     # Get links from assembly_graph_with_scaffolds.gfa
-    with open(assembly_graph_file) as file:
-        for line in file.readlines():
-            line = line.strip()
-
-            # Identify lines with link information
-            if line.startswith("L"):
-                strings = line.split("\t")
-                f1, f2 = strings[1] + strings[2], strings[3] + strings[4]
-                links_map[f1].add(f2)
-                links_map[f2].add(f1)
-                links.append(strings[1] + strings[2] + " " + strings[3] + strings[4])
+    # Identify lines with link information
+    gfa_links = read_links(assembly_graph_file)
+    strands = {1: "+", -1: "-", 0: ""}
+
+    for src, src_orient, dest, dest_orient in zip(
+        gfa_links.src.tolist(),
+        gfa_links.src_orient.tolist(),
+        gfa_links.dest.tolist(),
+        gfa_links.dest_orient.tolist(),
+    ):
+        f1 = gfa_links.names[src] + strands[src_orient]
+        f2 = gfa_links.names[dest] + strands[dest_orient]
+        links_map[f1].add(f2)
+        links_map[f2].add(f1)
 
     # Create graph
     assembly_graph = Graph()
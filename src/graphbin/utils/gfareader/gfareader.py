@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+"""
+Streaming reader for the records of assembly graph files in GFA and ASQG format.
+
+The file is read one line at a time, so that memory does not grow with the total
+length of the sequences in the graph, and only the lines of the record types
+asked for are split into fields.
+
+The links of large GFA files can also be read from a memory map of the file, with
+the sequences of the segments skipped over rather than read into lines.
+"""
+
+import mmap
+import os
+
+from collections import namedtuple
+
+import numpy as np
+
+
+__author__ = "Vijini Mallawaarachchi"
+__copyright__ = "Copyright 2019-2022, GraphBin Project"
+__credits__ = ["Vijini Mallawaarachchi"]
+__license__ = "BSD-3"
+__version__ = "1.6"
+__maintainer__ = "Vijini Mallawaarachchi"
+__email__ = "vijini.mallawaarachchi@anu.edu.au"
+__status__ = "Production"
+
+# names of the S records of a GFA file in file order, names of all its segments,
+# and the indices in names and orientations of the segments of its L records
+GFALinks = namedtuple(
+    "GFALinks", ["segments", "names", "src", "src_orient", "dest", "dest_orient"]
+)
+
+ORIENTATIONS = {b"+": 1, b"-": -1}
+
+
+def read_records(file_path, record_types):
+    """Yields the tab separated fields of each line of the graph file whose
+    record type is one of record_types, e.g. ("S", "L"), in file order."""
+    prefixes = tuple(record_type + "\t" for record_type in record_types)
+
+    with open(file_path) as file:
+        for line in file:
+            if line.startswith(prefixes):
+                yield line.strip().split("\t")
+
+
+def read_links(file_path):
+    """Reads the names of the segments and the links of a GFA file from a memory
+    map of the file, one line at a time, skipping the sequences of the segments.
+
+    Returns a GFALinks with the names of the S records in file order, and the
+    names of all the segments, those of S records first, with for each L record
+    the indices of its segments in these names and their orientations (1 for +,
+    -1 for -, 0 otherwise) as integer arrays."""
+    name_index = {}  # name -> index, in order of first appearance
+    segments = []
+    src, src_orient, dest, dest_orient = [], [], [], []
+
+    with open(file_path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        if data is not None:
+            find, read_line, seek, tell = data.find, data.readline, data.seek, data.tell
+            add_name = name_index.setdefault
+
+            while True:
+                pos = tell()
+                if pos >= size:
+                    break
+
+                if data[pos] == 83 and pos + 1 < size and data[pos + 1] == 9:  # "S\t"
+                    # only the name is read, the sequence after it is skipped
+                    end = find(b"\n", pos)
+                    if end == -1:
+                        end = size
+                    name_end = find(b"\t", pos + 2, end)
+                    if name_end == -1:
+                        name_end = end
+                    name = data[pos + 2 : name_end].strip()
+                    segments.append(add_name(name, len(name_index)))
+                    seek(min(end + 1, size))
+
+                else:
+                    # other records are read one line at a time
+                    line = read_line()
+                    if line.startswith(b"L\t"):
+                        fields = line.strip().split(b"\t", 5)
+                        src.append(add_name(fields[1], len(name_index)))
+                        src_orient.append(fields[2])
+                        dest.append(add_name(fields[3], len(name_index)))
+                        dest_orient.append(fields[4])
+
+            data.close()
+
+    # number the segments of S records first, then those only found in links
+    order = list(dict.fromkeys(segments))
+    order.extend(sorted(set(range(len(name_index))).difference(order)))
+    new_index = np.empty(len(name_index), dtype=np.int64)
+    new_index[order] = np.arange(len(name_index))
+    names = [name.decode() for name in name_index]
+
+    return GFALinks(
+        [names[i] for i in segments],
+        [names[i] for i in order],
+        new_index[np.array(src, dtype=np.int64)],
+        np.array([ORIENTATIONS.get(_, 0) for _ in src_orient], dtype=np.int8),
+        new_index[np.array(dest, dtype=np.int64)],
+        np.array([ORIENTATIONS.get(_, 0) for _ in dest_orient], dtype=np.int8),
+    )
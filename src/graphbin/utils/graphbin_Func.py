@@ -1,5 +1,28 @@
 #!/usr/bin/env python3
 
+import csv
+import json
+import logging
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from graphbin.utils.labelpropagation.chains import ChainCompression
+from graphbin.utils.labelpropagation.labelprop import (
+    LabelProp,
+    LabelPropResult,
+    get_graph_edges,
+)
+from graphbin.utils.labelpropagation.multilevellabelprop import (
+    MultilevelLabelProp,
+)
+from graphbin.utils.labelpropagation.sparselabelprop import SparseLabelProp
+
+
 __author__ = "Vijini Mallawaarachchi"
 __copyright__ = "Copyright 2019-2022, GraphBin Project"
 __credits__ = ["Vijini Mallawaarachchi", "Anuradha Wickramarachchi", "Yu Lin"]
@@ -9,16 +32,415 @@ __maintainer__ = "Vijini Mallawaarachchi"
 __email__ = "vijini.mallawaarachchi@anu.edu.au"
 __status__ = "Production"
 
+# create logger
+logger = logging.getLogger("GraphBin %s" % __version__)
+
+
+LABEL_PROPAGATION_ENGINES = {
+    "dict": LabelProp,
+    "sparse": SparseLabelProp,
+    "multilevel": MultilevelLabelProp,
+}
+
+
+def getLabelPropagator(args):
+    # Create the label propagation engine with the options given by the user
+    checkpoint_file = None
+    if args.checkpoint_iterations or args.checkpoint_seconds or args.resume:
+        checkpoint_file = args.output + args.prefix + "graphbin_lp_checkpoint.npz"
+
+    return LABEL_PROPAGATION_ENGINES[args.lp_engine](
+        frontier_tol=args.frontier_tol,
+        sparse_scores=args.sparse_scores,
+        top_k=args.top_k,
+        update=args.lp_update,
+        order=args.lp_order,
+        acceleration=args.acceleration,
+        acceleration_depth=args.acceleration_depth,
+        record_metrics=args.lp_metrics is not None,
+        checkpoint_file=checkpoint_file,
+        checkpoint_iterations=args.checkpoint_iterations,
+        checkpoint_seconds=args.checkpoint_seconds,
+        resume=args.resume,
+        precision=args.lp_precision,
+        warm_start_file=args.warm_start,
+        solver=args.lp_solver,
+        threads=args.threads,
+        freeze_tol=args.freeze_tol,
+        freeze_iterations=args.freeze_iterations,
+    )
+
+
+def runLabelPropagation(graph, vertices, labels, args):
+    # Run label propagation over the edges of the graph between vertices, on the
+    # whole graph or on each connected component in a pool of worker processes
+    # if lp_workers is set
+    if args.lp_workers:
+        src, dest = get_graph_edges(graph, vertices)
+        return runComponentLabelPropagation(vertices, labels, src, dest, args)
+
+    lp = getLabelPropagator(args)
+    if args.compress_chains:
+        src, dest = get_graph_edges(graph, vertices)
+        chains = ChainCompression(vertices, labels, src, dest)
+        vertex_ratio, edge_ratio = chains.get_reduction_ratio()
+        logger.info(
+            "Collapsed "
+            + str(len(chains.chain_ids))
+            + " contigs in "
+            + str(chains.chain_size)
+            + " chains, reduction ratio "
+            + "{:.3f}".format(vertex_ratio)
+            + " of the vertices and "
+            + "{:.3f}".format(edge_ratio)
+            + " of the edges"
+        )
+        lp.load_data_from_arrays(
+            chains.vertex_ids, chains.labels, chains.src, chains.dest, chains.weights
+        )
+    else:
+        lp.load_data_from_graph(graph, labels, vertices)
+    ans = lp.run(
+        args.diff_threshold,
+        args.max_iteration,
+        show_log=True,
+        clean_result=False,
+        result_arrays=True,
+    )
+
+    if args.lp_metrics is not None:
+        writeLabelPropagationMetrics(lp.metrics, args)
+
+    if args.save_scores:
+        scores_file = args.output + args.prefix + "graphbin_lp_scores.npz"
+        lp.save_scores(scores_file, lp.iterations, lp.diff)
+        logger.info("Label propagation scores can be found at " + scores_file)
+
+    if args.compress_chains:
+        ans = getChainResult(chains, lp, ans, vertices, labels)
+
+    return ans
+
+
+def getChainResult(chains, lp, ans, vertex_ids, labels):
+    # Add the contigs of the collapsed chains to the label propagation result of
+    # the reduced graph, with the best label of their interpolated scores
+    chain_scores = chains.interpolate(lp)
+    label_set = np.array(lp.get_labels(), dtype=np.int64)
+    if len(label_set) > 0:
+        best = chain_scores.argmax(axis=1)
+        chain_labels = label_set[best]
+        best_scores = chain_scores[np.arange(len(best)), best]
+    else:
+        chain_labels = np.zeros(len(chains.chain_ids), dtype=np.int64)
+        best_scores = np.zeros(len(chains.chain_ids))
+
+    result_ids = np.concatenate((ans.vertex_ids, chains.chain_ids))
+    order = getResultOrder(vertex_ids, labels, result_ids)
+
+    return LabelPropResult(
+        result_ids[order],
+        np.concatenate((ans.labels, chain_labels))[order],
+        np.concatenate((ans.scores, best_scores))[order],
+        None,
+    )
+
+
+def getResultOrder(vertex_ids, labels, result_ids):
+    # Order of result_ids which reports unlabelled vertices first and in input
+    # order, as a single label propagation run does
+    vertex_ids = np.asarray(vertex_ids, dtype=np.int64)
+    sorter = np.argsort(vertex_ids, kind="stable")
+    position = sorter[np.searchsorted(vertex_ids, result_ids, sorter=sorter)]
+    return np.lexsort((position, np.asarray(labels)[position] != 0))
+
+
+def writeLabelPropagationMetrics(metrics, args):
+    # Write the metrics of each label propagation iteration next to graphbin.log
+    metrics_file = args.output + args.prefix + "graphbin_lp_metrics." + args.lp_metrics
+
+    with open(metrics_file, mode="w") as out_file:
+        if args.lp_metrics == "json":
+            json.dump(metrics, out_file, indent=1)
+        else:
+            fieldnames = list(metrics[0].keys()) if len(metrics) > 0 else []
+            output_writer = csv.DictWriter(out_file, fieldnames=fieldnames)
+            output_writer.writeheader()
+            output_writer.writerows(metrics)
+
+    logger.info("Label propagation metrics can be found at " + metrics_file)
+
+
+def getDataComponents(vertex_ids, labels, src, dest):
+    # Split the label propagation input into the arrays of each connected
+    # component, in the order of their first vertex
+    vertex_ids = np.asarray(vertex_ids, dtype=np.int64)
+    labels = np.asarray(labels, dtype=np.int64)
+    n_vertices = len(vertex_ids)
+    if n_vertices == 0:
+        return []
+
+    sorter = np.argsort(vertex_ids, kind="stable")
+    src_index = sorter[np.searchsorted(vertex_ids, src, sorter=sorter)]
+    dest_index = sorter[np.searchsorted(vertex_ids, dest, sorter=sorter)]
+    adj = sparse.csr_matrix(
+        (np.ones(len(src_index)), (src_index, dest_index)),
+        shape=(n_vertices, n_vertices),
+    )
+    n_components, component = csgraph.connected_components(adj, connection="weak")
+
+    # number the components by their first vertex
+    first = np.unique(component, return_index=True)[1]
+    rank = np.empty(n_components, dtype=np.int64)
+    rank[np.argsort(first)] = np.arange(n_components)
+    component = rank[component]
+
+    # vertices and edges keep their input order within a component
+    vertex_order = np.argsort(component, kind="stable")
+    vertex_split = np.cumsum(np.bincount(component, minlength=n_components))[:-1]
+    edge_component = component[src_index]
+    edge_order = np.argsort(edge_component, kind="stable")
+    edge_split = np.cumsum(np.bincount(edge_component, minlength=n_components))[:-1]
+
+    return [
+        (vertex_ids[rows], labels[rows], src[edges], dest[edges])
+        for rows, edges in zip(
+            np.split(vertex_order, vertex_split), np.split(edge_order, edge_split)
+        )
+    ]
+
+
+def getComponentBatches(components, batch_size):
+    # Pack small components together so that each task has at least batch_size
+    # vertices, largest components first so that they start early
+    batches = []
+    batch = []
+    batch_vertices = 0
+
+    for component in sorted(components, key=lambda _: len(_[0]), reverse=True):
+        batch.append(component)
+        batch_vertices += len(component[0])
+        if batch_vertices >= batch_size:
+            batches.append(batch)
+            batch = []
+            batch_vertices = 0
+
+    if len(batch) > 0:
+        batches.append(batch)
+
+    return batches
+
+
+def initComponentWorker():
+    # Per component progress is summarised by the main process
+    logger.setLevel(logging.WARNING)
+
+
+def propagateComponents(batch, labels, args):
+    # Run label propagation separately on each component of a batch
+    results = []
+    stats = []
+
+    for vertex_ids, vertex_labels, src, dest in batch:
+        if vertex_labels.any():
+            lp = getLabelPropagator(args)
+            lp.load_data_from_arrays(vertex_ids, vertex_labels, src, dest)
+            results.append(
+                lp.run(args.diff_threshold, args.max_iteration, result_arrays=True)
+            )
+            # metrics of a component are identified by its first vertex
+            metrics = [dict(component=int(vertex_ids[0]), **row) for row in lp.metrics]
+            stats.append((lp.iterations, lp.diff, metrics))
+        else:
+            n_vertices = len(vertex_ids)
+            results.append(
+                LabelPropResult(
+                    vertex_ids,
+                    np.zeros(n_vertices, dtype=np.int64),
+                    np.zeros(n_vertices),
+                    None,
+                )
+            )
+
+    ans = LabelPropResult(
+        np.concatenate([_.vertex_ids for _ in results]),
+        np.concatenate([_.labels for _ in results]),
+        np.concatenate([_.scores for _ in results]),
+        None,
+    )
+
+    # Vertices without any score get the first label of the graph, as in a
+    # single run, and keep label 0 if the graph has no labels
+    if len(labels) > 0:
+        ans.labels[ans.scores == 0.0] = labels[0]
 
-def getClosestLabelledVertices(graph, node, binned_contigs):
+    return ans, stats
+
+
+def runComponentLabelPropagation(vertex_ids, labels, src, dest, args, batch_size=5000):
+    # Label propagation never moves labels between connected components, so each
+    # component is run on its own and is considered converged on its own diff
+    components = getDataComponents(vertex_ids, labels, src, dest)
+    batches = getComponentBatches(components, batch_size)
+    if len(components) == 0:
+        return LabelPropResult(
+            np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0), None
+        )
+    labels = np.asarray(labels)
+    label_set = np.unique(labels[labels != 0]).tolist()
+
+    logger.info(
+        "Running label propagation on "
+        + str(len(components))
+        + " connected components in "
+        + str(len(batches))
+        + " batches using "
+        + str(args.lp_workers)
+        + " worker processes"
+    )
+
+    if args.lp_workers == 1:
+        results = [propagateComponents(batch, label_set, args) for batch in batches]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=args.lp_workers, initializer=initComponentWorker
+        ) as executor:
+            results = list(
+                executor.map(
+                    propagateComponents,
+                    batches,
+                    [label_set] * len(batches),
+                    [args] * len(batches),
+                )
+            )
+
+    stats = [_ for batch_ans, batch_stats in results for _ in batch_stats]
+
+    logger.info(
+        "Maximum number of iterations in a component: "
+        + str(max((_[0] for _ in stats), default=0))
+    )
+    logger.info("Total diff over all components: " + str(sum(_[1] for _ in stats)))
+
+    if args.lp_metrics is not None:
+        metrics = [row for _ in stats for row in _[2]]
+        metrics.sort(key=lambda row: (row["component"], row["iteration"]))
+        writeLabelPropagationMetrics(metrics, args)
+
+    result_ids = np.concatenate([_[0].vertex_ids for _ in results])
+    order = getResultOrder(vertex_ids, labels, result_ids)
+
+    return LabelPropResult(
+        result_ids[order],
+        np.concatenate([_[0].labels for _ in results])[order],
+        np.concatenate([_[0].scores for _ in results])[order],
+        None,
+    )
+
+
+def getBinLists(contig_bin, contig_rank, n_bins):
+    # Contigs of each bin in the order they were added to it, from the bin of
+    # each contig (-1 if unbinned) and the rank of its addition
+    binned = np.flatnonzero(contig_bin >= 0)
+    binned = binned[np.lexsort((contig_rank[binned], contig_bin[binned]))]
+    split = np.cumsum(np.bincount(contig_bin[binned], minlength=n_bins))[:-1]
+    return [contigs.tolist() for contigs in np.split(binned, split)]
+
+
+def getAmbiguousVertices(graph, contig_bin):
+    # Binned vertices with a binned neighbour in another bin, and binned vertices
+    # with binned neighbours which are all in their own bin, as boolean masks
+    edges = np.array(graph.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    src = np.concatenate((edges[:, 0], edges[:, 1]))
+    dest = np.concatenate((edges[:, 1], edges[:, 0]))
+    src_bin = contig_bin[src]
+    dest_bin = contig_bin[dest]
+    binned = (src_bin >= 0) & (dest_bin >= 0)
+
+    ambiguous = np.zeros(len(contig_bin), dtype=bool)
+    ambiguous[src[binned & (src_bin != dest_bin)]] = True
+    neighbours_binned = np.zeros(len(contig_bin), dtype=bool)
+    neighbours_binned[src[binned]] = True
+
+    return ambiguous, neighbours_binned & ~ambiguous
+
+
+def updateAmbiguousVertices(
+    graph, contig_bin, evaluated_bin, evaluated_ambiguous, check=False
+):
+    # Ambiguous vertices as found by getAmbiguousVertices, given those found
+    # when the bins were evaluated_bin, re-evaluating only the vertices whose bin
+    # changed since and their neighbours. With check, compare with a full rescan.
+    changed = np.flatnonzero(contig_bin != evaluated_bin).tolist()
+    affected = np.unique(
+        np.array(
+            [i for neighbours in graph.neighborhood(changed) for i in neighbours],
+            dtype=np.int64,
+        )
+    )
+    neighbours = graph.neighborhood(affected.tolist(), mindist=1)
+    src = np.repeat(affected, [len(_) for _ in neighbours])
+    dest = np.array([i for _ in neighbours for i in _], dtype=np.int64)
+    src_bin = contig_bin[src]
+    dest_bin = contig_bin[dest]
+
+    ambiguous = evaluated_ambiguous.copy()
+    ambiguous[affected] = False
+    ambiguous[src[(src_bin >= 0) & (dest_bin >= 0) & (src_bin != dest_bin)]] = True
+
+    logger.info("Number of contigs re-evaluated for ambiguity: " + str(len(affected)))
+
+    if check and not np.array_equal(
+        ambiguous, getAmbiguousVertices(graph, contig_bin)[0]
+    ):
+        raise Exception("Re-evaluated ambiguous contigs differ from a full rescan")
+
+    return ambiguous
+
+
+def getRemovedLabels(contig_bin, contig_rank, ambiguous, n_removed, min_bin_count):
+    # Ambiguous binned vertices to remove the labels of, bin by bin in the order
+    # they were added to it, while the bin keeps at least min_bin_count vertices
+    # besides the n_removed already removed from it, which is updated
+    n_bins = len(n_removed)
+    bin_size = np.bincount(contig_bin[contig_bin >= 0], minlength=n_bins)
+    vertices = np.flatnonzero(ambiguous & (contig_bin >= 0))
+    vertices = vertices[np.lexsort((contig_rank[vertices], contig_bin[vertices]))]
+    vertex_bin = contig_bin[vertices]
+
+    # position of each vertex among the ambiguous vertices of its bin
+    position = np.arange(len(vertices)) - np.searchsorted(vertex_bin, vertex_bin)
+    n_allowed = np.maximum(bin_size - n_removed - min_bin_count + 1, 0)
+    removed = vertices[position < n_allowed[vertex_bin]]
+    n_removed += np.bincount(contig_bin[removed], minlength=n_bins)
+
+    return removed.tolist()
+
+
+def getLabelledComponents(graph, labelled_vertices):
+    # Vertices in the connected components of graph with a labelled vertex, as a
+    # boolean mask
+    membership = np.array(graph.components().membership, dtype=np.int64)
+    labelled = np.zeros(membership.max() + 1 if len(membership) else 0, dtype=bool)
+    labelled[membership[np.asarray(labelled_vertices, dtype=np.int64)]] = True
+    return labelled[membership]
+
+
+def getClosestLabelledVertices(graph, node, binned_contigs, max_hops=None):
     # Remove labels of ambiguous vertices
     # -------------------------------------
 
     queu_l = [graph.neighbors(node, mode="ALL")]
     visited_l = [node]
     labelled = []
+    hops = 0
 
     while len(queu_l) > 0:
+        # No labelled vertices within max_hops
+        hops += 1
+        if max_hops is not None and hops > max_hops:
+            break
+
         active_level = queu_l.pop(0)
         is_finish = False
         visited_l += active_level
@@ -42,3 +464,107 @@ def getClosestLabelledVertices(graph, node, binned_contigs):
             if len(temp2) > 0:
                 queu_l.append(temp2)
     return labelled
+
+
+def getCSRAdjacency(graph):
+    # Neighbours of each vertex of graph as in graph.neighbors, with a loop
+    # listed twice, as indptr and indices arrays
+    n_vertices = graph.vcount()
+    edges = np.array(graph.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    src = np.concatenate((edges[:, 0], edges[:, 1]))
+    dest = np.concatenate((edges[:, 1], edges[:, 0]))
+    order = np.argsort(src, kind="stable")
+    indptr = np.zeros(n_vertices + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n_vertices), out=indptr[1:])
+    return indptr, dest[order]
+
+
+def getNeighbourPairs(indptr, indices, query, vertex):
+    # (query, neighbour) pairs of the neighbours of each (query, vertex) pair
+    counts = indptr[vertex + 1] - indptr[vertex]
+    total = int(counts.sum())
+    offsets = np.repeat(indptr[vertex] - np.cumsum(counts) + counts, counts)
+    return np.repeat(query, counts), indices[offsets + np.arange(total)]
+
+
+def getNearestSources(indptr, indices, sources, keys, max_hops=None, k=2):
+    # The k closest distinct keys of each vertex and their distances, with a
+    # breadth first search from all the sources at once, each source having the
+    # key of the same index. Returns vertices x k arrays of keys and distances,
+    # closest first and -1 where fewer keys are found within max_hops.
+    n_vertices = len(indptr) - 1
+    n_keys = int(keys.max()) + 1 if len(keys) > 0 else 1
+    found_key = np.full((n_vertices, k), -1, dtype=np.int64)
+    found_dist = np.full((n_vertices, k), -1, dtype=np.int64)
+    count = np.zeros(n_vertices, dtype=np.int64)
+
+    found_key[sources, 0] = keys
+    found_dist[sources, 0] = 0
+    count[sources] = 1
+    key, vertex = keys, sources
+    level = 0
+
+    while len(vertex) > 0 and (max_hops is None or level < max_hops):
+        level += 1
+
+        # keys reaching the neighbours of the last level, without those they have
+        key, vertex = getNeighbourPairs(indptr, indices, key, vertex)
+        new = (count[vertex] < k) & np.all(found_key[vertex] != key[:, None], axis=1)
+        vertex, key = np.divmod(np.unique(vertex[new] * n_keys + key[new]), n_keys)
+
+        # the keys of a vertex fill its free slots, and only those found are
+        # passed on to the next level
+        slot = count[vertex] + np.arange(len(vertex)) - np.searchsorted(vertex, vertex)
+        found = slot < k
+        vertex, key, slot = vertex[found], key[found], slot[found]
+        found_key[vertex, slot] = key
+        found_dist[vertex, slot] = level
+        count += np.bincount(vertex, minlength=n_vertices)
+
+    return found_key, found_dist
+
+
+def getClosestAmbiguousVertices(graph, contig_bin, nodes, max_hops=None):
+    # Labelled vertices among nodes with a closest labelled vertex, as found by
+    # getClosestLabelledVertices, in another bin, as a boolean mask. Also returns
+    # the distance of each labelled vertex to its closest other labelled vertex
+    # (-1 if there is none within max_hops), and the nodes with a labelled vertex
+    # in their component further than max_hops only.
+    indptr, indices = getCSRAdjacency(graph)
+    labelled = np.flatnonzero(contig_bin >= 0)
+    nodes = np.asarray(nodes, dtype=np.int64)
+
+    # a labelled vertex is the closest of its own labelled vertices and bins, so
+    # the second closest ones are the others
+    distance = getNearestSources(indptr, indices, labelled, labelled, max_hops)[1]
+    distance = distance[:, 1]
+    other_distance = getNearestSources(
+        indptr, indices, labelled, contig_bin[labelled], max_hops
+    )[1][:, 1]
+
+    # a vertex with a loop is its own neighbour
+    if max_hops is None or max_hops >= 1:
+        rows = np.repeat(np.arange(len(contig_bin)), np.diff(indptr))
+        loops = rows[indices == rows]
+        distance[loops[contig_bin[loops] >= 0]] = 1
+
+    ambiguous = np.zeros(len(contig_bin), dtype=bool)
+    ambiguous[nodes] = (distance[nodes] > 0) & (
+        other_distance[nodes] == distance[nodes]
+    )
+
+    limited = []
+    if max_hops is not None:
+        n_components, membership = csgraph.connected_components(
+            sparse.csr_matrix(
+                (np.ones(len(indices)), indices, indptr),
+                shape=(len(contig_bin), len(contig_bin)),
+            ),
+            directed=False,
+        )
+        n_labelled = np.bincount(membership[labelled], minlength=n_components)
+        limited = nodes[
+            (distance[nodes] < 0) & (n_labelled[membership[nodes]] > 1)
+        ].tolist()
+
+    return ambiguous, distance, limited
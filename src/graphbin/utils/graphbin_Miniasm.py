@@ -18,13 +18,24 @@ import subprocess
 import sys
 import time
 
+import numpy as np
+
 from cogent3.parse.fasta import MinimalFastaParser
 from igraph import *
 
 from graphbin.utils.bidirectionalmap.bidirectionalmap import BidirectionalMap
-from graphbin.utils.graphbin_Func import getClosestLabelledVertices
+from graphbin.utils.gfareader.gfareader import read_links
+from graphbin.utils.graphbin_Func import (
+    getAmbiguousVertices,
+    getBinLists,
+    getClosestAmbiguousVertices,
+    getLabelledComponents,
+    getRemovedLabels,
+    runLabelPropagation,
+    updateAmbiguousVertices,
+)
 from graphbin.utils.graphbin_Options import PARSER
-from graphbin.utils.labelpropagation.labelprop import LabelProp
+
 
 __author__ = "Vijini Mallawaarachchi"
 __copyright__ = "Copyright 2019-2022, GraphBin Project"
@@ -66,6 +77,7 @@ def run(args):
     delimiter = args.delimiter
     max_iteration = args.max_iteration
     diff_threshold = args.diff_threshold
+    lp_engine = args.lp_engine
     MIN_BIN_COUNT = 10
 
     # Setup output path for log file
@@ -88,6 +100,7 @@ def run(args):
     logger.info("Final binning output file: " + output_path)
     logger.info("Maximum number of iterations: " + str(max_iteration))
     logger.info("Difference threshold: " + str(diff_threshold))
+    logger.info("Label propagation engine: " + lp_engine)
 
     logger.info("GraphBin started")
 
@@ -129,35 +142,20 @@ def run(args):
 
     nodes = []
 
-    links = []
-
     try:
         # Get contig connections from .gfa file
-        with open(assembly_graph_file) as file:
-
-            for line in file.readlines():
-                line = line.strip()
-
-                # Count the number of contigs
-                if line.startswith("S"):
-                    strings = line.split("\t")
-                    my_node = strings[1]
-                    my_map[node_count] = my_node
-                    nodes.append(my_node)
-                    node_count += 1
-
-                # Identify lines with link information
-                elif line.startswith("L"):
+        gfa_links = read_links(assembly_graph_file)
 
-                    link = []
-                    strings = line.split("\t")
+        # Count the number of contigs
+        for my_node in gfa_links.segments:
+            my_map[node_count] = my_node
+            nodes.append(my_node)
+            node_count += 1
 
-                    if strings[1] != strings[3]:
-                        start = strings[1]
-                        end = strings[3]
-                        link.append(start)
-                        link.append(end)
-                        links.append(link)
+        # Identify links between different contigs
+        not_loop = gfa_links.src != gfa_links.dest
+        link_src = gfa_links.src[not_loop]
+        link_dest = gfa_links.dest[not_loop]
 
     except BaseException as err:
         logger.error(f"Unexpected {err}")
@@ -180,9 +178,6 @@ def run(args):
         # Create the graph
         assembly_graph = Graph()
 
-        # Create list of edges
-        edge_list = []
-
         # Add vertices
         assembly_graph.add_vertices(node_count)
 
@@ -191,12 +186,14 @@ def run(args):
             assembly_graph.vs[i]["id"] = i
             assembly_graph.vs[i]["label"] = str(contigs_map[i])
 
-        # Iterate links
-        for link in links:
-            # Remove self loops
-            if link[0] != link[1]:
-                # Add edge to list of edges
-                edge_list.append((contigs_map_rev[link[0]], contigs_map_rev[link[1]]))
+        # Links to segments without an S record have no contig
+        missing = np.concatenate((link_src, link_dest))
+        missing = missing[missing >= node_count]
+        if len(missing) > 0:
+            raise KeyError(gfa_links.names[missing[0]])
+
+        # Segments are numbered as their contigs, add edges to list of edges
+        edge_list = list(zip(link_src.tolist(), link_dest.tolist()))
 
         # Add edges to the graph
         assembly_graph.add_edges(edge_list)
@@ -217,7 +214,14 @@ def run(args):
 
     logger.info("Obtaining the initial binning result")
 
-    bins = [[] for x in range(n_bins)]
+    # Bin of each contig, -1 if unbinned, and the order the contigs were added
+    # to their bins in
+    contig_bin = np.full(node_count, -1, dtype=np.int64)
+    contig_rank = np.zeros(node_count, dtype=np.int64)
+    n_binned = 0
+
+    # Check if initial binning result consists of contigs belonging to multiple bins
+    multiple_bins = False
 
     try:
         with open(contig_bins_file) as contig_bins:
@@ -226,7 +230,13 @@ def run(args):
                 contig_num = contigs_map_rev[row[0]]
 
                 bin_num = bins_list.index(row[1])
-                bins[bin_num].append(contig_num)
+
+                if contig_bin[contig_num] == -1:
+                    contig_bin[contig_num] = bin_num
+                    contig_rank[contig_num] = n_binned
+                    n_binned += 1
+                elif contig_bin[contig_num] != bin_num:
+                    multiple_bins = True
 
     except BaseException as err:
         logger.error(f"Unexpected {err}")
@@ -236,108 +246,63 @@ def run(args):
         logger.info("Exiting GraphBin... Bye...!")
         sys.exit(1)
 
+    if multiple_bins:
+        logger.error(
+            "Initial binning result consists of contigs belonging to multiple bins. Please make sure that each contig in the initial binning result belongs to only one bin."
+        )
+        logger.info("Exiting GraphBin... Bye...!")
+        sys.exit(1)
+
     # Remove labels of ambiguous vertices
     # -------------------------------------
 
     logger.info("Determining ambiguous vertices")
 
-    remove_by_bin = {}
-
-    remove_labels = []
-
-    neighbours_have_same_label_list = []
-
-    for b in range(n_bins):
-
-        for i in bins[b]:
+    # Number of labels removed from each bin
+    n_removed = np.zeros(n_bins, dtype=np.int64)
 
-            my_bin = b
-
-            # Get set of closest labelled vertices with distance = 1
-            closest_neighbours = assembly_graph.neighbors(i, mode=ALL)
-
-            # Determine whether all the closest labelled vertices have the same label as its own
-            neighbours_have_same_label = True
-
-            neighbours_binned = False
-
-            for neighbour in closest_neighbours:
-                for k in range(n_bins):
-                    if neighbour in bins[k]:
-                        neighbours_binned = True
-                        if k != my_bin:
-                            neighbours_have_same_label = False
-                            break
-
-            if not neighbours_have_same_label:
-                if my_bin in remove_by_bin:
-                    if len(bins[my_bin]) - len(remove_by_bin[my_bin]) >= MIN_BIN_COUNT:
-                        remove_labels.append(i)
-                        remove_by_bin[my_bin].append(i)
-                else:
-                    if len(bins[my_bin]) >= MIN_BIN_COUNT:
-                        remove_labels.append(i)
-                        remove_by_bin[my_bin] = [i]
+    # Determine whether all the closest labelled vertices with distance = 1 have
+    # the same label as their own
+    ambiguous, neighbours_have_same_label = getAmbiguousVertices(
+        assembly_graph, contig_bin
+    )
+    remove_labels = getRemovedLabels(
+        contig_bin, contig_rank, ambiguous, n_removed, MIN_BIN_COUNT
+    )
 
-            elif neighbours_binned:
-                neighbours_have_same_label_list.append(i)
+    # Bins the ambiguous vertices were determined with, to only re-evaluate the
+    # vertices whose bins change later
+    evaluated_bin = contig_bin.copy()
+    evaluated_ambiguous = ambiguous
 
-    for i in remove_labels:
-        for n in range(n_bins):
-            if i in bins[n]:
-                bins[n].remove(i)
+    contig_bin[remove_labels] = -1
 
     # Further remove labels of ambiguous vertices
-    binned_contigs = []
-
-    for n in range(n_bins):
-        binned_contigs = sorted(binned_contigs + bins[n])
-
-    for b in range(n_bins):
-
-        for i in bins[b]:
-
-            if i not in neighbours_have_same_label_list:
-
-                my_bin = b
-
-                # Get set of closest labelled vertices
-                closest_neighbours = getClosestLabelledVertices(
-                    assembly_graph, i, binned_contigs
-                )
-
-                if len(closest_neighbours) > 0:
-
-                    # Determine whether all the closest labelled vertices have the same label as its own
-                    neighbours_have_same_label = True
+    binned_contigs = np.flatnonzero(contig_bin >= 0).tolist()
+
+    # Determine whether the closest labelled vertices of each vertex all have the
+    # same label as its own
+    ambiguous, _, hop_limited = getClosestAmbiguousVertices(
+        assembly_graph,
+        contig_bin,
+        np.flatnonzero((contig_bin >= 0) & ~neighbours_have_same_label),
+        max_hops=args.max_hops,
+    )
 
-                    for neighbour in closest_neighbours:
-                        for k in range(n_bins):
-                            if neighbour in bins[k]:
-                                if k != my_bin:
-                                    neighbours_have_same_label = False
-                                    break
+    if args.max_hops is not None:
+        logger.info(
+            "Number of contigs without labelled contigs within max_hops: "
+            + str(len(hop_limited))
+        )
 
-                    if not neighbours_have_same_label and i not in remove_labels:
-                        if my_bin in remove_by_bin:
-                            if (
-                                len(bins[my_bin]) - len(remove_by_bin[my_bin])
-                                >= MIN_BIN_COUNT
-                            ):
-                                remove_labels.append(i)
-                                remove_by_bin[my_bin].append(i)
-                        else:
-                            if len(bins[my_bin]) >= MIN_BIN_COUNT:
-                                remove_labels.append(i)
-                                remove_by_bin[my_bin] = [i]
+    remove_labels += getRemovedLabels(
+        contig_bin, contig_rank, ambiguous, n_removed, MIN_BIN_COUNT
+    )
 
     logger.info("Removing labels of ambiguous vertices")
 
     # Remove labels of ambiguous vertices
-    for i in remove_labels:
-        for n in range(n_bins):
-            if i in bins[n]:
-                bins[n].remove(i)
+    contig_bin[remove_labels] = -1
 
     logger.info("Obtaining refined binning result")
 
@@ -348,107 +313,21 @@ def run(args):
         "Deteremining vertices which are not isolated and not in components without any labels"
     )
 
-    non_isolated = []
-
-    for i in range(node_count):
-
-        if i not in non_isolated and i in binned_contigs:
-
-            component = []
-            component.append(i)
-            length = len(component)
-            neighbours = assembly_graph.neighbors(i, mode=ALL)
-
-            for neighbor in neighbours:
-                if neighbor not in component:
-                    component.append(neighbor)
+    non_isolated = getLabelledComponents(assembly_graph, binned_contigs)
 
-            component = list(set(component))
-
-            while length != len(component):
-
-                length = len(component)
-
-                for j in component:
-
-                    neighbours = assembly_graph.neighbors(j, mode=ALL)
-
-                    for neighbor in neighbours:
-                        if neighbor not in component:
-                            component.append(neighbor)
-
-            labelled = False
-            for j in component:
-                if j in binned_contigs:
-                    labelled = True
-                    break
-
-            if labelled:
-                for j in component:
-                    if j not in non_isolated:
-                        non_isolated.append(j)
-
-    logger.info("Number of non-isolated contigs: " + str(len(non_isolated)))
+    logger.info(
+        "Number of non-isolated contigs: " + str(np.count_nonzero(non_isolated))
+    )
 
     # Run label propagation
     # -----------------------
 
-    data = []
-
-    for contig in range(node_count):
-
-        # Consider vertices that are not isolated
-
-        if contig in non_isolated:
-            line = []
-            line.append(contig)
-
-            assigned = False
-
-            for i in range(n_bins):
-                if contig in bins[i]:
-                    line.append(i + 1)
-                    assigned = True
-
-            if not assigned:
-                line.append(0)
-
-            neighbours = assembly_graph.neighbors(contig, mode=ALL)
-
-            neighs = []
-
-            for neighbour in neighbours:
-                n = []
-                n.append(neighbour)
-                n.append(1.0)
-                neighs.append(n)
-
-            line.append(neighs)
-
-            data.append(line)
-
-    # Check if initial binning result consists of contigs belonging to multiple bins
-
-    multiple_bins = False
-
-    for item in data:
-        if type(item[1]) is int and type(item[2]) is int:
-            multiple_bins = True
-            break
-
-    if multiple_bins:
-        logger.error(
-            "Initial binning result consists of contigs belonging to multiple bins. Please make sure that each contig in the initial binning result belongs to only one bin."
-        )
-        logger.info("Exiting GraphBin... Bye...!")
-        sys.exit(1)
+    # Consider vertices that are not isolated
+    vertices = np.flatnonzero(non_isolated).tolist()
+    labels = (contig_bin[vertices] + 1).tolist()
 
     # Label propagation
 
-    lp = LabelProp()
-
-    lp.load_data_from_mem(data)
-
     logger.info(
         "Starting label propagation with eps="
         + str(diff_threshold)
@@ -456,59 +335,42 @@ def run(args):
         + str(max_iteration)
     )
 
-    ans = lp.run(diff_threshold, max_iteration, show_log=True, clean_result=False)
+    ans = runLabelPropagation(assembly_graph, vertices, labels, args)
 
     logger.info("Obtaining Label Propagation result")
 
-    for l in ans:
-        for i in range(n_bins):
-            if l[1] == i + 1 and l[0] not in bins[i]:
-                bins[i].append(l[0])
+    # Add the contigs labelled by label propagation to their bins
+    added = (contig_bin[ans.vertex_ids] == -1) & (ans.labels > 0)
+    n_added = int(np.count_nonzero(added))
+    contig_bin[ans.vertex_ids[added]] = ans.labels[added] - 1
+    contig_rank[ans.vertex_ids[added]] = n_binned + np.arange(n_added)
+    n_binned += n_added
 
     # Remove labels of ambiguous vertices
     # -------------------------------------
 
     logger.info("Determining ambiguous vertices")
 
-    remove_by_bin = {}
-
-    remove_labels = []
-
-    for b in range(n_bins):
-
-        for i in bins[b]:
-
-            my_bin = b
+    n_removed = np.zeros(n_bins, dtype=np.int64)
 
-            closest_neighbours = assembly_graph.neighbors(i, mode=ALL)
-
-            # Determine whether all the closest labelled vertices have the same label as its own
-            neighbours_have_same_label = True
-
-            for neighbour in closest_neighbours:
-                for k in range(n_bins):
-                    if neighbour in bins[k]:
-                        if k != my_bin:
-                            neighbours_have_same_label = False
-                            break
-
-            if not neighbours_have_same_label:
-                if my_bin in remove_by_bin:
-                    if len(bins[my_bin]) - len(remove_by_bin[my_bin]) >= MIN_BIN_COUNT:
-                        remove_labels.append(i)
-                        remove_by_bin[my_bin].append(i)
-                else:
-                    if len(bins[my_bin]) >= MIN_BIN_COUNT:
-                        remove_labels.append(i)
-                        remove_by_bin[my_bin] = [i]
+    # Determine whether all the closest labelled vertices have the same label as
+    # their own, for the vertices whose bins changed and their neighbours
+    ambiguous = updateAmbiguousVertices(
+        assembly_graph,
+        contig_bin,
+        evaluated_bin,
+        evaluated_ambiguous,
+        check=args.check_ambiguity,
+    )
+    remove_labels = getRemovedLabels(
+        contig_bin, contig_rank, ambiguous, n_removed, MIN_BIN_COUNT
+    )
 
     logger.info("Removing labels of ambiguous vertices")
 
     # Remove labels of ambiguous vertices
-    for i in remove_labels:
-        for n in range(n_bins):
-            if i in bins[n]:
-                bins[n].remove(i)
+    contig_bin[remove_labels] = -1
+    bins = getBinLists(contig_bin, contig_rank, n_bins)
 
     elapsed_time = time.time() - start_time
 
@@ -574,7 +436,7 @@ def run(args):
     unbinned_contigs = []
 
     for i in range(node_count):
-        if i in remove_labels or i not in non_isolated:
+        if i in remove_labels or not non_isolated[i]:
             line = []
             line.append(str(contigs_map[i]))
             unbinned_contigs.append(line)
@@ -47,3 +47,167 @@ PARSER.add_argument(
     default=0.1,
     help="difference threshold for label propagation algorithm. [default: 0.1]",
 )
+
+PARSER.add_argument(
+    "--lp_engine",
+    type=str,
+    default="dict",
+    choices=["dict", "sparse", "multilevel"],
+    help="label propagation engine. 'dict' iterates over the vertices one at a time and 'sparse' uses sparse matrix products, which is much faster on large assembly graphs. Both give the same result. 'multilevel' solves label propagation on coarsened assembly graphs first, which converges in far fewer iterations on large assembly graphs with long paths. [default: dict]",
+)
+
+PARSER.add_argument(
+    "--frontier_tol",
+    type=float,
+    default=None,
+    help="recompute only the vertices having a neighbour whose label scores changed by more than this tolerance in the previous iteration. Disabled by default, a value of 0 gives the same result as the default mode with less work.",
+)
+
+PARSER.add_argument(
+    "--lp_workers",
+    type=int,
+    default=0,
+    help="run label propagation separately on each connected component of the assembly graph using this many worker processes. Each component is considered converged on its own diff. [default: 0, propagate on the whole graph in a single process]",
+)
+
+PARSER.add_argument(
+    "--sparse_scores",
+    default=False,
+    action="store_true",
+    help="store only the non-zero label scores of each contig, so that memory scales with the reach of the labels rather than the number of bins. Only supported by the dict engine.",
+)
+
+PARSER.add_argument(
+    "--top_k",
+    type=int,
+    default=None,
+    help="keep only the k highest label scores of each contig. Requires --sparse_scores. [default: keep all]",
+)
+
+PARSER.add_argument(
+    "--lp_update",
+    type=str,
+    default="jacobi",
+    choices=["jacobi", "gauss-seidel"],
+    help="label propagation update. 'jacobi' computes every iteration from the scores of the previous one and 'gauss-seidel' updates the scores in place, so that they are used within the same sweep. [default: jacobi]",
+)
+
+PARSER.add_argument(
+    "--lp_order",
+    type=str,
+    default="input",
+    choices=["input", "bfs"],
+    help="order of the vertices in a gauss-seidel sweep, either the input order or breadth first from the labelled contigs. [default: input]",
+)
+
+PARSER.add_argument(
+    "--acceleration",
+    type=str,
+    default=None,
+    choices=["anderson", "aitken"],
+    help="extrapolate the label scores from the previous iterations to converge in fewer iterations. [default: None]",
+)
+
+PARSER.add_argument(
+    "--acceleration_depth",
+    type=int,
+    default=5,
+    help="number of previous iterations used by anderson acceleration. [default: 5]",
+)
+
+PARSER.add_argument(
+    "--lp_metrics",
+    type=str,
+    default=None,
+    choices=["csv", "json"],
+    help="write the diff, wall time, number of contigs whose label changed and number of contigs without any label score of each label propagation iteration to graphbin_lp_metrics.csv or .json next to graphbin.log. [default: None]",
+)
+
+PARSER.add_argument(
+    "--checkpoint_iterations",
+    type=int,
+    default=None,
+    help="save the label scores to graphbin_lp_checkpoint.npz in the output folder every this many label propagation iterations. [default: None]",
+)
+
+PARSER.add_argument(
+    "--checkpoint_seconds",
+    type=float,
+    default=None,
+    help="save the label scores to graphbin_lp_checkpoint.npz in the output folder at most this many seconds apart. [default: None]",
+)
+
+PARSER.add_argument(
+    "--resume",
+    action="store_true",
+    help="continue label propagation from graphbin_lp_checkpoint.npz in the output folder, if it exists.",
+)
+
+PARSER.add_argument(
+    "--lp_precision",
+    type=str,
+    default="float64",
+    choices=["float64", "float32"],
+    help="floating point precision of the label scores of the sparse engine. float32 halves the memory of the scores, but very small diff_threshold values may never be reached or may be reached early. [default: float64]",
+)
+
+PARSER.add_argument(
+    "--save_scores",
+    action="store_true",
+    help="save the final label scores to graphbin_lp_scores.npz in the output folder, so that a later run can be warm started from them.",
+)
+
+PARSER.add_argument(
+    "--warm_start",
+    type=str,
+    default=None,
+    help="path to the graphbin_lp_scores.npz or graphbin_lp_checkpoint.npz file of a previous run on the same assembly graph. Label propagation starts from its scores instead of 0. [default: None]",
+)
+
+PARSER.add_argument(
+    "--lp_solver",
+    type=str,
+    default="iterate",
+    choices=["iterate", "cg"],
+    help="'cg' solves for the label scores which label propagation converges to with the conjugate gradient method before iterating. Only supported by the sparse engine. [default: iterate]",
+)
+
+PARSER.add_argument(
+    "--threads",
+    type=int,
+    default=1,
+    help="number of threads updating blocks of bins concurrently in each label propagation iteration, which speeds up graphs with a single large component. Only supported by the sparse engine. [default: 1]",
+)
+
+PARSER.add_argument(
+    "--freeze_tol",
+    type=float,
+    default=None,
+    help="stop updating a contig once its label has not changed and its label scores changed by at most this tolerance for freeze_iterations consecutive iterations. Disabled by default.",
+)
+
+PARSER.add_argument(
+    "--freeze_iterations",
+    type=int,
+    default=3,
+    help="number of consecutive iterations for freeze_tol. [default: 3]",
+)
+
+PARSER.add_argument(
+    "--compress_chains",
+    action="store_true",
+    help="collapse chains of unlabelled contigs with two neighbours each into single weighted edges before label propagation, and interpolate their label scores afterwards.",
+)
+
+PARSER.add_argument(
+    "--max_hops",
+    type=int,
+    default=None,
+    help="maximum number of hops searched for the closest labelled contigs of a contig when removing labels of ambiguous contigs. Contigs without labelled contigs within max_hops keep their labels. Unlimited by default.",
+)
+
+PARSER.add_argument(
+    "--check_ambiguity",
+    action="store_true",
+    help="check that re-evaluating only the contigs whose bins changed finds the same ambiguous contigs as evaluating all contigs again. For debugging.",
+)
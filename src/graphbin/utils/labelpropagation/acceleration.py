@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+"""
+Fixed-point acceleration of the label propagation iteration.
+
+Label propagation converges linearly to the fixed point of F = G(F), where G is one
+label propagation iteration. The classes here extrapolate from the previous iterates
+of G to a point closer to the fixed point. They work on the scores of the unlabelled
+vertices only, so that the labelled vertices stay clamped.
+"""
+
+import numpy as np
+
+
+__author__ = "Vijini Mallawaarachchi"
+__copyright__ = "Copyright 2019-2022, GraphBin Project"
+__credits__ = ["Vijini Mallawaarachchi"]
+__license__ = "BSD-3"
+__version__ = "1.6"
+__maintainer__ = "Vijini Mallawaarachchi"
+__email__ = "vijini.mallawaarachchi@anu.edu.au"
+__status__ = "Production"
+
+
+class AndersonAcceleration:
+    """Anderson mixing over the last depth iterates."""
+
+    def __init__(self, depth=5):
+        self.depth = depth
+        self.reset()
+
+    def reset(self):
+        self.d_f = []  # [array(float)], differences of successive residuals G(x) - x
+        self.d_g = []  # [array(float)], differences of successive G(x)
+        self.gram = np.zeros((0, 0))  # inner products of d_f
+        self.f = None  # array(float), last residual
+        self.g = None  # array(float), last G(x)
+
+    def extrapolate(self, x, g):
+        """returns the next iterate after x and g = G(x), or None to take the
+        plain step g"""
+        f = (g - x).ravel()
+        g = g.ravel()
+
+        if self.f is None:
+            self.f, self.g = f, g
+            return None
+
+        d_f = f - self.f
+        self.d_f.append(d_f)
+        self.d_g.append(g - self.g)
+        self.f, self.g = f, g
+
+        # keep the inner products of the last depth differences up to date
+        dots = np.array([np.dot(_, d_f) for _ in self.d_f])
+        gram = np.zeros((len(self.d_f), len(self.d_f)))
+        gram[:-1, :-1] = self.gram[-(len(self.d_f) - 1) :, -(len(self.d_f) - 1) :]
+        gram[-1, :] = gram[:, -1] = dots
+        if len(self.d_f) > self.depth:
+            self.d_f.pop(0)
+            self.d_g.pop(0)
+            gram = gram[1:, 1:]
+        self.gram = gram
+
+        # mixing coefficients minimise the norm of the combined residuals
+        rhs = np.array([np.dot(_, f) for _ in self.d_f])
+        gamma = np.linalg.lstsq(self.gram, rhs, rcond=None)[0]
+
+        x_next = g.copy()
+        for coeff, d_g in zip(gamma, self.d_g):
+            x_next -= coeff * d_g
+        np.maximum(x_next, 0.0, out=x_next)
+
+        return x_next.reshape(x.shape)
+
+
+class AitkenAcceleration:
+    """Aitken delta-squared extrapolation from three successive iterates, with
+    the rate of convergence estimated over all the scores."""
+
+    def __init__(self, depth=None):
+        self.reset()
+
+    def reset(self):
+        self.x_hist = []  # [array(float)], successive iterates
+
+    def extrapolate(self, x, g):
+        """returns the next iterate after x and g = G(x), or None to take the
+        plain step g"""
+        if len(self.x_hist) == 0:
+            self.x_hist.append(x)
+        self.x_hist.append(g)
+
+        if len(self.x_hist) < 3:
+            return None
+
+        x0, x1, x2 = self.x_hist
+        self.reset()
+
+        d1 = (x1 - x0).ravel()
+        d2 = (x2 - x1).ravel()
+        d1_norm = np.dot(d1, d1)
+        if d1_norm == 0.0:
+            return None
+
+        # d2 = rate * d1 when a single rate of convergence dominates, and the
+        # remaining steps sum to d2 * rate / (1 - rate)
+        rate = np.dot(d1, d2) / d1_norm
+        if not 0.0 < rate < 1.0:
+            return None
+
+        x_next = x2 + (rate / (1.0 - rate)) * (x2 - x1)
+        np.maximum(x_next, 0.0, out=x_next)
+
+        return x_next
+
+
+ACCELERATORS = {"anderson": AndersonAcceleration, "aitken": AitkenAcceleration}
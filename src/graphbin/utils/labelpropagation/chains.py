@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+"""
+Compression of the chains of unlabelled degree-2 vertices of a graph before label
+propagation.
+
+The scores label propagation converges to are harmonic, so along a chain of
+unlabelled vertices with two edges each they change linearly with the resistance
+(the sum of 1 / weight of the edges) from one end of the chain. A chain is
+replaced by a single edge between its ends with the weight of its edges in
+series, which leaves the scores of all the other vertices unchanged, and the
+scores of its vertices are interpolated from those of its ends afterwards.
+"""
+
+import numpy as np
+
+from graphbin.utils.labelpropagation.labelprop import get_positions
+
+
+__author__ = "Vijini Mallawaarachchi"
+__copyright__ = "Copyright 2019-2022, GraphBin Project"
+__credits__ = ["Vijini Mallawaarachchi"]
+__license__ = "BSD-3"
+__version__ = "1.6"
+__maintainer__ = "Vijini Mallawaarachchi"
+__email__ = "vijini.mallawaarachchi@anu.edu.au"
+__status__ = "Production"
+
+
+class ChainCompression:
+    """The graph of vertex_ids, labels (0 if unlabelled) and edges src -> dest,
+    given in both directions, with the chains of unlabelled degree-2 vertices
+    collapsed into weighted edges."""
+
+    def __init__(self, vertex_ids, labels, src, dest, weights=None):
+        vertex_ids = np.asarray(vertex_ids, dtype=np.int64)
+        labels = np.asarray(labels, dtype=np.int64)
+        n_vertices = len(vertex_ids)
+        src_pos = get_positions(vertex_ids, src)[0]
+        dest_pos = get_positions(vertex_ids, dest)[0]
+        if weights is None:
+            weights = np.ones(len(src_pos))
+        weights = np.asarray(weights, dtype=np.float64)
+        self.input_size = (n_vertices, len(src_pos))
+
+        # vertices inside a chain are unlabelled with two edges, neither a loop
+        deg = np.bincount(src_pos, minlength=n_vertices)
+        loops = np.zeros(n_vertices, dtype=bool)
+        loops[src_pos[src_pos == dest_pos]] = True
+        interior = (labels == 0) & (deg == 2) & ~loops
+
+        order = np.argsort(src_pos, kind="stable")
+        adj_dest = dest_pos[order].tolist()
+        adj_weight = weights[order].tolist()
+        indptr = np.zeros(n_vertices + 1, dtype=np.int64)
+        np.cumsum(deg, out=indptr[1:])
+        indptr = indptr.tolist()
+        interior_list = interior.tolist()
+
+        collapsed = np.zeros(n_vertices, dtype=bool)
+        chain_vertices = []  # [int], positions of the collapsed vertices
+        chain_start = []  # [int], positions of the first end of their chain
+        chain_end = []  # [int], positions of the other end of their chain
+        chain_position = []  # [float], resistance from the start / total
+        chain_src, chain_dest, chain_weight = [], [], []
+        self.chain_size = 0
+
+        # walk each chain from the first of its ends found
+        for edge in np.flatnonzero(~interior[src_pos] & interior[dest_pos]).tolist():
+            start, vertex = int(src_pos[edge]), int(dest_pos[edge])
+            if collapsed[vertex]:
+                continue
+
+            prev = start
+            path = []
+            resistance = [1.0 / weights[edge]]
+            while interior_list[vertex] and not collapsed[vertex]:
+                collapsed[vertex] = True
+                path.append(vertex)
+                # leave by the edge which is not the one back to prev
+                next_edge = indptr[vertex]
+                if adj_dest[next_edge] == prev:
+                    next_edge += 1
+                prev, vertex = vertex, adj_dest[next_edge]
+                resistance.append(resistance[-1] + 1.0 / adj_weight[next_edge])
+
+            # a chain from a vertex back to itself has the scores of that vertex
+            end = start if interior_list[vertex] else vertex
+            total = resistance[-1]
+            chain_vertices.extend(path)
+            chain_start.extend([start] * len(path))
+            chain_end.extend([end] * len(path))
+            chain_position.extend(_ / total for _ in resistance[: len(path)])
+            self.chain_size += 1
+            if end != start:
+                chain_src.extend([start, end])
+                chain_dest.extend([end, start])
+                chain_weight.extend([1.0 / total, 1.0 / total])
+
+        # the reduced graph, and the ends of the chains by their positions in it
+        keep = ~collapsed
+        new_position = np.cumsum(keep) - 1
+        kept_edges = keep[src_pos] & keep[dest_pos]
+        self.vertex_ids = vertex_ids[keep]
+        self.labels = labels[keep]
+        self.src = vertex_ids[
+            np.concatenate((src_pos[kept_edges], np.array(chain_src, dtype=np.int64)))
+        ]
+        self.dest = vertex_ids[
+            np.concatenate((dest_pos[kept_edges], np.array(chain_dest, dtype=np.int64)))
+        ]
+        self.weights = np.concatenate((weights[kept_edges], chain_weight))
+
+        chain_vertices = np.array(chain_vertices, dtype=np.int64)
+        self.chain_ids = vertex_ids[chain_vertices]
+        self.chain_start = new_position[np.array(chain_start, dtype=np.int64)]
+        self.chain_end = new_position[np.array(chain_end, dtype=np.int64)]
+        self.chain_position = np.array(chain_position, dtype=np.float64)
+
+    def get_reduction_ratio(self):
+        # vertices and edges of the reduced graph over those of the input graph
+        n_vertices, n_edges = self.input_size
+        return (
+            len(self.vertex_ids) / n_vertices if n_vertices else 1.0,
+            len(self.src) / n_edges if n_edges else 1.0,
+        )
+
+    def interpolate(self, lp):
+        # scores of the collapsed vertices, chain vertices x labels, from the
+        # scores of the LabelProp lp run on the reduced graph
+        labels = lp.get_labels()
+        scores = np.zeros((len(self.vertex_ids), len(labels)))
+        unlabelled_ids = np.asarray(lp.get_unlabelled_ids(), dtype=np.int64)
+        if len(unlabelled_ids) > 0:
+            scores[get_positions(self.vertex_ids, unlabelled_ids)[0]] = lp.get_scores()
+        labelled = np.flatnonzero(self.labels)
+        scores[labelled, np.searchsorted(labels, self.labels[labelled])] = 1.0
+
+        position = self.chain_position[:, None]
+        return (1.0 - position) * scores[self.chain_start] + position * scores[
+            self.chain_end
+        ]
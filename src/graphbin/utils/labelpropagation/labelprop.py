@@ -5,6 +5,16 @@ This code has been modified from the source found at https://github.com/ZwEin27/
 """
 
 import logging
+import os
+import time
+
+from array import array
+from collections import namedtuple
+
+import numpy as np
+
+from graphbin.utils.labelpropagation.acceleration import ACCELERATORS
+
 
 __author__ = "Vijini Mallawaarachchi"
 __copyright__ = "Copyright 2019-2022, GraphBin Project"
@@ -18,18 +28,110 @@ __status__ = "Production"
 # create logger
 logger = logging.getLogger("GraphBin %s" % __version__)
 
+# arrays with the best label of each vertex and its score, in the order of the
+# rows of LabelProp.debug(), and the margin to the second best score if requested
+LabelPropResult = namedtuple(
+    "LabelPropResult", ["vertex_ids", "labels", "scores", "margins"]
+)
+
+
+def get_graph_edges(graph, vertices):
+    # edges between vertices of an igraph Graph in both directions, ordered by
+    # the position of their source in vertices and then by their destination,
+    # as the neighbours of each vertex are listed by Graph.neighbors
+    edges = np.array(graph.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    src = np.concatenate((edges[:, 0], edges[:, 1]))
+    dest = np.concatenate((edges[:, 1], edges[:, 0]))
+
+    position = np.full(graph.vcount(), -1, dtype=np.int64)
+    position[np.asarray(vertices, dtype=np.int64)] = np.arange(len(vertices))
+    keep = (position[src] >= 0) & (position[dest] >= 0)
+    src, dest = src[keep], dest[keep]
+    order = np.lexsort((dest, position[src]))
+
+    return src[order], dest[order]
+
 
-class Edge:
-    def __init__(self, src, dest, weight):
-        self.src = src
-        self.dest = dest
-        self.weight = weight
+def get_positions(values, keys):
+    # positions of keys in values, and whether each key was found
+    values = np.asarray(values)
+    keys = np.asarray(keys, dtype=values.dtype)
+    if len(values) == 0:
+        return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+
+    sorter = np.argsort(values, kind="stable")
+    pos = np.minimum(np.searchsorted(values, keys, sorter=sorter), len(values) - 1)
+    positions = sorter[pos]
+    return positions, values[positions] == keys
 
 
 class LabelProp:
-    def __init__(self):
+    def __init__(
+        self,
+        frontier_tol=None,
+        sparse_scores=False,
+        top_k=None,
+        update="jacobi",
+        order="input",
+        acceleration=None,
+        acceleration_depth=5,
+        record_metrics=False,
+        checkpoint_file=None,
+        checkpoint_iterations=None,
+        checkpoint_seconds=None,
+        resume=False,
+        precision="float64",
+        warm_start_file=None,
+        solver="iterate",
+        threads=1,
+        freeze_tol=None,
+        freeze_iterations=3,
+    ):
         self.logger = logging.getLogger("GraphBin %s" % __version__)
         self.logger.info("Creating an instance of LabelProp")
+        # when set, only vertices with a neighbour whose scores changed by more
+        # than frontier_tol in the previous iteration are recomputed
+        self.frontier_tol = frontier_tol
+        # when set, vertex_f_map keeps only the non-zero scores of each vertex,
+        # optionally only the top_k highest of them
+        self.sparse_scores = sparse_scores
+        self.top_k = top_k
+        # "jacobi" computes all the scores of an iteration from the previous
+        # iteration, "gauss-seidel" updates the scores in place so that later
+        # vertices of a sweep already see them. order is the order of the sweep,
+        # "input" or "bfs" from the labelled vertices
+        self.update = update
+        self.order = order
+        # when set, the scores of the unlabelled vertices are extrapolated from
+        # the previous iterations with "anderson" or "aitken" acceleration
+        self.acceleration = acceleration
+        self.acceleration_depth = acceleration_depth
+        # when set, run() records the diff, wall time, number of vertices whose
+        # label changed and number of vertices without scores of each iteration
+        self.record_metrics = record_metrics
+        # the scores are saved to checkpoint_file every checkpoint_iterations
+        # iterations or checkpoint_seconds seconds, and at the end of run(). With
+        # resume, run() continues from the scores saved in checkpoint_file
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_iterations = checkpoint_iterations
+        self.checkpoint_seconds = checkpoint_seconds
+        self.resume = resume
+        # floating point type of the scores of the array engines, "float64" or
+        # "float32"
+        self.precision = precision
+        # when set, the unlabelled vertices start from the scores saved by
+        # save_scores() in a previous run instead of 0
+        self.warm_start_file = warm_start_file
+        # "cg" solves for the scores the iteration converges to with conjugate
+        # gradients before iterating, so that only a few iterations are needed
+        self.solver = solver
+        # number of threads updating blocks of label columns of the array engines
+        self.threads = threads
+        # when set, an unlabelled vertex is frozen and no longer updated once its
+        # best label stayed the same and its scores changed by at most
+        # freeze_tol for freeze_iterations consecutive iterations
+        self.freeze_tol = freeze_tol
+        self.freeze_iterations = freeze_iterations
         self.initialize_env()
 
     ################################################################################
@@ -37,37 +139,44 @@ class LabelProp:
     ################################################################################
 
     def initialize_env(self):
-        self.vertex_adj_map = {}  # int: [Edge]
-        self.vertex_in_adj_map = {}  # int: float
+        self.vertex_adj_map = {}  # int: [int], destinations of the out-edges
+        self.vertex_in_adj_map = {}  # int: ([int], [float]), sources and weights
         self.vertex_deg_map = {}  # int, float
         self.vertex_label_map = {}  # int, int
         self.label_index_map = {}  # int, int
-        self.vertex_f_map = {}  # int, [float]
+        self.vertex_f_map = {}  # int, [float] or {int: float} if sparse_scores
         self.vertex_size = 0
         self.label_size = 0
         self.labelled_size = 0
+        self.frontier = None  # {int: None}, unlabelled vertices to recompute
+        self.vertex_order = None  # [int], unlabelled vertices in sweep order
+        self.vertex_updates = 0
+        self.iterations = 0
+        self.diff = 0.0
+        self.run_time = 0.0
+        self.accelerator = None
+        self.accelerated_steps = 0
+        self.rejected_steps = 0
+        self._unlabelled_ids = None  # [int], rows of get_scores
+        self._next_scores = None  # array(float), extrapolated scores to continue from
+        self._plain_scores = None  # array(float), scores of the plain step instead
+        self._last_diff = None
+        self._vertex_ids = array("q")  # rows collected by load_data_from_mem
+        self._labels = array("q")
+        self._edge_counts = array("q")  # number of edges of each row
+        self._edge_dest = array("q")
+        self._edge_weight = array("d")
+        self.metrics = []  # [dict], one per iteration if record_metrics
+        self._best_labels = None  # array(int), see get_best_labels
+        self.resumed_iteration = 0
+        self.solver_iterations = 0
+        self._checkpoint_time = None
+        self.frozen = {}  # {int: None}, unlabelled vertices which are not updated
+        self.frozen_size = 0
+        self.settled = {}  # int: int, consecutive iterations a vertex was settled
 
     def setup_env(self):
 
-        # initialize vertex_in_adj_map
-        for vertex_id in self.vertex_adj_map.keys():
-            if vertex_id not in self.vertex_in_adj_map:
-                self.vertex_in_adj_map.setdefault(vertex_id, [])
-
-        # setup vertex_in_adj_map
-        for vertex_id in self.vertex_in_adj_map.keys():
-            for edge in self.vertex_adj_map[vertex_id]:
-                self.vertex_in_adj_map[edge.dest].append(edge)
-
-        # setup vertex_deg_map
-        for vertex_id in self.vertex_adj_map.keys():
-            degree = 0.0
-            if vertex_id in self.vertex_deg_map:
-                degree = self.vertex_deg_map[vertex_id]
-            for edge in self.vertex_adj_map[vertex_id]:
-                degree += edge.weight
-            self.vertex_deg_map[vertex_id] = degree
-
         # setup vertex_f_map
         v_set = self.vertex_label_map.keys()
         l_set = self.vertex_label_map.values()
@@ -84,6 +193,15 @@ class LabelProp:
 
         self.labelled_size = 0
         for v in v_set:
+            if self.sparse_scores:
+                l = self.vertex_label_map[v]
+                if int(l) == 0:
+                    self.vertex_f_map.setdefault(v, {})
+                else:
+                    self.labelled_size += 1
+                    self.vertex_f_map.setdefault(v, {self.label_index_map[l]: 1.0})
+                continue
+
             arr = []
             l = int(self.vertex_label_map[v])
             if l == 0:
@@ -110,12 +228,99 @@ class LabelProp:
             self.load_data_from_mem(lines)
 
     def load_data_from_mem(self, data):
+        # the rows are collected into typed arrays for load_data_from_arrays
         self.initialize_env()
-        self.vertex_size = len(data)
         for line in data:
             self.process_data_line(line)
+        vertex_ids = np.frombuffer(self._vertex_ids, dtype=np.int64)
+        labels = np.frombuffer(self._labels, dtype=np.int64)
+        edge_counts = np.frombuffer(self._edge_counts, dtype=np.int64)
+        dest = np.frombuffer(self._edge_dest, dtype=np.int64)
+        weights = np.frombuffer(self._edge_weight, dtype=np.float64)
+
+        # the rows of a vertex after its first one are ignored
+        first = np.zeros(len(vertex_ids), dtype=bool)
+        first[np.unique(vertex_ids, return_index=True)[1]] = True
+        src = np.repeat(vertex_ids, edge_counts)
+        if not first.all():
+            first_edges = np.repeat(first, edge_counts)
+            vertex_ids, labels = vertex_ids[first], labels[first]
+            src, dest, weights = (
+                src[first_edges],
+                dest[first_edges],
+                weights[first_edges],
+            )
+
+        self.load_data_from_arrays(vertex_ids, labels, src, dest, weights)
+
+    def load_data_from_graph(self, graph, labels, vertices=None):
+        # propagate over the edges of an igraph Graph between vertices, all the
+        # vertices of the graph by default, with labels given in the same order
+        if vertices is None:
+            vertices = np.arange(graph.vcount())
+        src, dest = get_graph_edges(graph, vertices)
+        self.load_data_from_arrays(vertices, labels, src, dest)
+
+    def load_data_from_arrays(self, vertex_ids, labels, src, dest, weights=None):
+        # vertex_ids and labels (0 if unlabelled) of the vertices, and the edges
+        # src -> dest between them with weights, 1.0 by default
+        self.initialize_env()
+        self.vertex_size = len(vertex_ids)
+        if weights is None:
+            weights = np.ones(len(src))
+        self.load_adjacency(
+            np.asarray(vertex_ids),
+            np.asarray(labels),
+            np.asarray(src),
+            np.asarray(dest),
+            np.asarray(weights, dtype=np.float64),
+        )
         self.setup_env()
 
+    def load_adjacency(self, vertex_ids, labels, src, dest, weights):
+        # the adjacency lists hold the ids of vertex_ids and one float object per
+        # distinct weight, out-edges in input order and in-edges by source vertex
+        src_pos, found_src = get_positions(vertex_ids, src)
+        dest_pos, found_dest = get_positions(vertex_ids, dest)
+        if not (found_src.all() and found_dest.all()):
+            raise Exception("Coundn't find the vertices of an edge")
+
+        ids = vertex_ids.tolist()
+        n_vertices = len(ids)
+
+        # degree of a vertex is the total weight of its out-edges
+        degrees = np.bincount(src_pos, weights=weights, minlength=n_vertices)
+        for vertex_id, vertex_label, degree in zip(
+            ids, labels.tolist(), degrees.tolist()
+        ):
+            self.vertex_label_map[vertex_id] = vertex_label
+            self.vertex_deg_map[vertex_id] = degree
+
+        # slices of lists of all the edges, which are freed once sliced
+        out_dest = list(
+            map(ids.__getitem__, dest_pos[np.argsort(src_pos, kind="stable")])
+        )
+        ends = np.cumsum(np.bincount(src_pos, minlength=n_vertices)).tolist()
+        start = 0
+        for vertex_id, end in zip(ids, ends):
+            self.vertex_adj_map[vertex_id] = out_dest[start:end]
+            start = end
+        del out_dest
+
+        unique_weights, weight_index = np.unique(weights, return_inverse=True)
+        order = np.lexsort((src_pos, dest_pos))
+        in_src = list(map(ids.__getitem__, src_pos[order]))
+        in_weight = list(map(unique_weights.tolist().__getitem__, weight_index[order]))
+        del order, weight_index
+        ends = np.cumsum(np.bincount(dest_pos, minlength=n_vertices)).tolist()
+        start = 0
+        for vertex_id, end in zip(ids, ends):
+            self.vertex_in_adj_map[vertex_id] = (
+                in_src[start:end],
+                in_weight[start:end],
+            )
+            start = end
+
     def process_data_line(self, line):
         # [vertexId, vertexLabel, [edges]]
         # unlabeled vertex if vertexLabel == 0
@@ -125,13 +330,12 @@ class LabelProp:
             vertex_id = line[0]
             vertex_label = line[1]
             edges = line[2]
-            edge_list = []
-            self.vertex_label_map.setdefault(vertex_id, vertex_label)
+            self._vertex_ids.append(vertex_id)
+            self._labels.append(vertex_label)
+            self._edge_counts.append(len(edges))
             for edge in edges:
-                dest_vertex_id = int(edge[0])
-                edge_weight = float(edge[1])
-                edge_list.append(Edge(vertex_id, dest_vertex_id, edge_weight))
-            self.vertex_adj_map.setdefault(vertex_id, edge_list)
+                self._edge_dest.append(int(edge[0]))
+                self._edge_weight.append(float(edge[1]))
 
         except Exception as e:
 
@@ -148,6 +352,8 @@ class LabelProp:
         ans = []
         for vertex_id in self.vertex_f_map.keys():
             arr = self.vertex_f_map[vertex_id]
+            if self.sparse_scores:
+                arr = [arr.get(i, 0.0) for i in range(len(labels))]
             max_f_val = 0.0
             max_f_val_idx = 0
 
@@ -164,33 +370,63 @@ class LabelProp:
 
         return ans
 
+    def get_result(self, margins=False):
+        labels = self.get_labels()
+        vertex_ids = []
+        best_labels = []
+        best_scores = []
+        best_margins = []
+
+        for vertex_id, arr in self.vertex_f_map.items():
+            if self.sparse_scores:
+                arr = [arr.get(i, 0.0) for i in range(len(labels))]
+            max_f_val = 0.0
+            max_f_val_idx = 0
+            second_f_val = 0.0
+
+            for i in range(len(labels)):
+                f_val = arr[i]
+                if f_val > max_f_val:
+                    second_f_val = max_f_val
+                    max_f_val = f_val
+                    max_f_val_idx = i
+                elif f_val > second_f_val:
+                    second_f_val = f_val
+
+            vertex_ids.append(vertex_id)
+            best_labels.append(labels[max_f_val_idx])
+            best_scores.append(max_f_val)
+            best_margins.append(max_f_val - second_f_val)
+
+        return LabelPropResult(
+            np.array(vertex_ids, dtype=np.int64),
+            np.array(best_labels, dtype=np.int64),
+            np.array(best_scores, dtype=np.float64),
+            np.array(best_margins, dtype=np.float64) if margins else None,
+        )
+
     def iterate(self):
+        if self.frontier_tol is not None:
+            return self.iterate_frontier()
+        if self.update == "gauss-seidel":
+            return self.iterate_in_place()
+
         next_vertex_f_map = {}  # int, [double]
         diff = 0
 
         for vertex_id in self.vertex_f_map.keys():
             if self.vertex_label_map[vertex_id]:  # skip labelled
                 continue
+            if vertex_id in self.frozen:
+                next_vertex_f_map[vertex_id] = self.vertex_f_map[vertex_id]
+                continue
 
             # update F(vertex_id) .. vertex_f_map
-            next_f_value = []  # double
-            f_values = self.vertex_f_map[vertex_id]
-
-            for i in range(self.label_size):
-                f_value = 0.0
-
-                for edge in self.vertex_in_adj_map[vertex_id]:
-                    weight = edge.weight
-                    src = edge.src
-                    deg = self.vertex_deg_map[vertex_id]
-                    f_value += self.vertex_f_map[src][i] * (weight / deg)
-                next_f_value.append(f_value)
-                if self.vertex_label_map[vertex_id] == 0:
-                    if f_value > f_values[i]:
-                        diff += f_value - f_values[i]
-                    else:
-                        diff += f_values[i] - f_value
-                next_vertex_f_map[vertex_id] = next_f_value
+            next_f_value, vertex_diff = self.get_next_f_value(vertex_id)
+            if self.freeze_tol is not None:
+                self.update_settled(vertex_id, next_f_value, vertex_diff)
+            next_vertex_f_map[vertex_id] = next_f_value
+            diff += vertex_diff
 
         for vertex_id in self.vertex_label_map.keys():
             if self.vertex_label_map[vertex_id] == 0:
@@ -201,17 +437,417 @@ class LabelProp:
 
         return diff
 
-    def run(self, eps, max_iter, show_log=False, clean_result=False):
+    def iterate_frontier(self):
+        if self.frontier is None:
+            # only vertices next to a labelled vertex can change in the first iteration
+            self.frontier = {}
+            for vertex_id in self.vertex_label_map.keys():
+                if self.vertex_label_map[vertex_id]:
+                    self.enqueue_neighbours(vertex_id, self.frontier)
+
+        next_frontier = {}
+        updated_f_map = {}  # int, [double]
+        diff = 0
+
+        for vertex_id in self.frontier:
+            next_f_value, vertex_diff = self.get_next_f_value(vertex_id)
+            if self.update == "gauss-seidel":
+                self.vertex_f_map[vertex_id] = next_f_value
+            else:
+                updated_f_map[vertex_id] = next_f_value
+            diff += vertex_diff
+
+            # neighbours of a vertex which changed have to be recomputed
+            if vertex_diff > self.frontier_tol:
+                self.enqueue_neighbours(vertex_id, next_frontier)
+
+        self.vertex_updates += len(self.frontier)
+        self.vertex_f_map.update(updated_f_map)
+        self.frontier = next_frontier
+
+        return diff
+
+    def iterate_in_place(self):
+        if self.vertex_order is None:
+            self.vertex_order = self.get_vertex_order()
+
+        diff = 0
+
+        for vertex_id in self.vertex_order:
+            if vertex_id in self.frozen:
+                continue
+            next_f_value, vertex_diff = self.get_next_f_value(vertex_id)
+            if self.freeze_tol is not None:
+                self.update_settled(vertex_id, next_f_value, vertex_diff)
+            self.vertex_f_map[vertex_id] = next_f_value
+            diff += vertex_diff
+
+        return diff
+
+    def update_settled(self, vertex_id, next_f_value, vertex_diff):
+        # a vertex is settled in an iteration if it has a best label, which is
+        # the same as before, and its scores changed by at most freeze_tol
+        f_values = self.vertex_f_map[vertex_id]
+        best = max(range(self.label_size), key=f_values.__getitem__, default=0)
+        next_best = max(range(self.label_size), key=next_f_value.__getitem__, default=0)
+        if (
+            self.label_size
+            and next_f_value[next_best] > 0.0
+            and best == next_best
+            and vertex_diff <= self.freeze_tol
+        ):
+            self.settled[vertex_id] = self.settled.get(vertex_id, 0) + 1
+            if self.settled[vertex_id] >= self.freeze_iterations:
+                self.frozen[vertex_id] = None
+                self.frozen_size += 1
+        else:
+            self.settled[vertex_id] = 0
+
+    def get_vertex_order(self):
+        unlabelled = [v for v in self.vertex_f_map if not self.vertex_label_map[v]]
+        if self.order != "bfs":
+            return unlabelled
+
+        # breadth first from all the labelled vertices, so that the scores of a
+        # vertex are updated after those of the vertices closer to the labels
+        visited = {v: None for v in self.vertex_f_map if self.vertex_label_map[v]}
+        queue = list(visited)
+        vertex_order = []
+
+        while len(queue) > 0:
+            next_queue = []
+            for vertex_id in queue:
+                for dest in self.vertex_adj_map[vertex_id]:
+                    if dest not in visited:
+                        visited[dest] = None
+                        vertex_order.append(dest)
+                        next_queue.append(dest)
+            queue = next_queue
+
+        # vertices which cannot be reached from a label go last
+        vertex_order.extend(v for v in unlabelled if v not in visited)
+
+        return vertex_order
+
+    def iterate_accelerated(self):
+        if self.accelerator is None:
+            self.accelerator = ACCELERATORS[self.acceleration](self.acceleration_depth)
+
+        # the extrapolated scores are only taken up here, so that the scores of a
+        # converged run are always those of a plain step
+        extrapolated = self._next_scores is not None
+        if extrapolated:
+            self.set_scores(self._next_scores)
+            self._next_scores = None
+
+        scores = self.get_scores()
+        diff = self.iterate()
+
+        if extrapolated and diff > self._last_diff:
+            # the extrapolated scores increased the residual, continue from the
+            # plain step instead
+            self.set_scores(self._plain_scores)
+            self.accelerator.reset()
+            self.rejected_steps += 1
+            return self._last_diff
+
+        next_scores = self.get_scores()
+        self._next_scores = self.accelerator.extrapolate(scores, next_scores)
+        if self._next_scores is not None:
+            self._plain_scores = next_scores
+            self.accelerated_steps += 1
+        self._last_diff = diff
+
+        return diff
+
+    def get_scores(self):
+        # scores of the unlabelled vertices, unlabelled vertices x labels
+        unlabelled_ids = self.get_unlabelled_ids()
+        if self.sparse_scores:
+            scores = np.zeros((len(unlabelled_ids), self.label_size))
+            for row, vertex_id in enumerate(unlabelled_ids):
+                for i, f_value in self.vertex_f_map[vertex_id].items():
+                    scores[row, i] = f_value
+            return scores
+        return np.array(
+            [self.vertex_f_map[v] for v in unlabelled_ids], dtype=np.float64
+        ).reshape(len(unlabelled_ids), self.label_size)
+
+    def get_unlabelled_ids(self):
+        if self._unlabelled_ids is None:
+            self._unlabelled_ids = [
+                v for v in self.vertex_f_map if not self.vertex_label_map[v]
+            ]
+        return self._unlabelled_ids
+
+    def get_best_labels(self):
+        # index of the highest score of each unlabelled vertex, the first one if
+        # tied as in debug(), and -1 if all its scores are 0
+        if self.sparse_scores:
+            best = []
+            for vertex_id in self.get_unlabelled_ids():
+                f_values = self.vertex_f_map[vertex_id]
+                i = min(f_values, key=lambda _: (-f_values[_], _), default=-1)
+                best.append(i if i >= 0 and f_values[i] > 0.0 else -1)
+            return np.array(best, dtype=np.int64)
+
+        scores = self.get_scores()
+        if self.label_size == 0:
+            return np.full(len(scores), -1, dtype=np.int64)
+        best = scores.argmax(axis=1)
+        best[scores.max(axis=1) <= 0.0] = -1
+        return best
+
+    def record_iteration(self, iteration, diff, iteration_time):
+        best_labels = self.get_best_labels()
+        self.metrics.append(
+            {
+                "iteration": iteration,
+                "diff": float(diff),
+                "time": iteration_time,
+                "label_changes": int((best_labels != self._best_labels).sum()),
+                "unscored_vertices": int((best_labels < 0).sum()),
+            }
+        )
+        if self.freeze_tol is not None:
+            self.metrics[-1]["frozen_vertices"] = self.frozen_size
+        self._best_labels = best_labels
+
+    def set_scores(self, scores):
+        for vertex_id, f_value in zip(self.get_unlabelled_ids(), scores.tolist()):
+            if self.sparse_scores:
+                f_value = {i: _ for i, _ in enumerate(f_value) if _ != 0.0}
+            self.vertex_f_map[vertex_id] = f_value
+
+    def get_settled(self):
+        # consecutive iterations each unlabelled vertex was settled, in the order
+        # of get_unlabelled_ids(), frozen vertices have at least freeze_iterations
+        return np.array(
+            [self.settled.get(_, 0) for _ in self.get_unlabelled_ids()], dtype=np.int64
+        )
+
+    def set_settled(self, settled):
+        self.settled = {}
+        self.frozen = {}
+        for vertex_id, count in zip(self.get_unlabelled_ids(), settled.tolist()):
+            if count > 0:
+                self.settled[vertex_id] = count
+            if count >= self.freeze_iterations:
+                self.frozen[vertex_id] = None
+        self.frozen_size = len(self.frozen)
+
+    def get_labels(self):
+        # labels in the order of their index
+        return sorted(self.label_index_map, key=self.label_index_map.get)
+
+    def reset_frontier(self):
+        # recompute all the unlabelled vertices in the next iteration
+        self.frontier = dict.fromkeys(self.get_unlabelled_ids())
+
+    def save_scores(self, scores_file, iteration, diff):
+        # written to a temporary file first, so that a run killed while saving
+        # leaves the previous file intact
+        scores_tmp = scores_file + ".tmp"
+        # with freeze_tol, the settled iterations of each vertex are saved too so
+        # that a resumed run freezes the same vertices
+        freezing = {}
+        if self.freeze_tol is not None:
+            freezing["settled"] = self.get_settled()
+        with open(scores_tmp, "wb") as scores:
+            np.savez(
+                scores,
+                vertex_ids=np.asarray(self.get_unlabelled_ids(), dtype=np.int64),
+                labels=np.asarray(self.get_labels(), dtype=np.int64),
+                scores=self.get_scores(),
+                iteration=iteration,
+                diff=diff,
+                **freezing,
+            )
+        os.replace(scores_tmp, scores_file)
+
+    def save_checkpoint(self, iteration, diff):
+        self.save_scores(self.checkpoint_file, iteration, diff)
+        self._checkpoint_time = time.time()
+        logger.debug("Saved checkpoint at iteration " + str(iteration))
+
+    def load_checkpoint(self):
+        # returns the iteration and diff of the checkpoint, or 0 if there is none
+        if not os.path.exists(self.checkpoint_file):
+            logger.info("No checkpoint found at " + self.checkpoint_file)
+            return 0, 0.0
+
+        with np.load(self.checkpoint_file) as checkpoint:
+            if not (
+                np.array_equal(checkpoint["vertex_ids"], self.get_unlabelled_ids())
+                and np.array_equal(checkpoint["labels"], self.get_labels())
+            ):
+                raise Exception(
+                    "Checkpoint "
+                    + self.checkpoint_file
+                    + " does not match the label propagation input"
+                )
+            self.set_scores(checkpoint["scores"])
+            if self.freeze_tol is not None and "settled" in checkpoint:
+                self.set_settled(checkpoint["settled"])
+            iteration = int(checkpoint["iteration"])
+            diff = float(checkpoint["diff"])
+
+        if self.frontier_tol is not None:
+            self.reset_frontier()
+
+        self.resumed_iteration = iteration
+        logger.info("Resuming label propagation from iteration " + str(iteration))
+
+        return iteration, diff
+
+    def load_warm_start(self):
+        # saved scores of the unlabelled vertices for the labels of this run,
+        # vertices and labels which were not saved start from 0
+        with np.load(self.warm_start_file) as scores_file:
+            saved_ids = scores_file["vertex_ids"]
+            saved_labels = scores_file["labels"]
+            saved_scores = scores_file["scores"]
+
+        rows, has_row = get_positions(saved_ids, self.get_unlabelled_ids())
+        cols, has_col = get_positions(saved_labels, self.get_labels())
+
+        scores = np.zeros((len(rows), self.label_size))
+        scores[np.ix_(has_row, has_col)] = saved_scores[
+            np.ix_(rows[has_row], cols[has_col])
+        ]
+        self.set_scores(scores)
+
+        if self.frontier_tol is not None:
+            self.reset_frontier()
+
+        logger.info(
+            "Warm start from "
+            + self.warm_start_file
+            + " with saved scores for "
+            + str(int(has_row.sum()))
+            + " of "
+            + str(len(rows))
+            + " unlabelled vertices"
+        )
+
+    def solve(self, eps):
+        raise Exception(
+            "The " + self.solver + " solver is only supported by SparseLabelProp"
+        )
+
+    def checkpoint_due(self, iteration):
+        if (
+            self.checkpoint_iterations is not None
+            and iteration % self.checkpoint_iterations == 0
+        ):
+            return True
+        return (
+            self.checkpoint_seconds is not None
+            and time.time() - self._checkpoint_time >= self.checkpoint_seconds
+        )
+
+    def get_next_f_value(self, vertex_id):
+        # scores of an unlabelled vertex from the scores of its in-neighbours,
+        # and the total change from its current scores
+        f_values = self.vertex_f_map[vertex_id]
+        deg = self.vertex_deg_map[vertex_id]
+        in_src, in_weight = self.vertex_in_adj_map[vertex_id]
+
+        if self.sparse_scores:
+            next_f_value = {}  # int, double
+            for src, weight in zip(in_src, in_weight):
+                weight = weight / deg
+                for i, f_value in self.vertex_f_map[src].items():
+                    next_f_value[i] = next_f_value.get(i, 0.0) + f_value * weight
+
+            if self.top_k is not None and len(next_f_value) > self.top_k:
+                top = sorted(next_f_value.items(), key=lambda _: (-_[1], _[0]))
+                next_f_value = dict(top[: self.top_k])
+
+            vertex_diff = 0
+            for i in f_values.keys() | next_f_value.keys():
+                vertex_diff += abs(next_f_value.get(i, 0.0) - f_values.get(i, 0.0))
+
+            return next_f_value, vertex_diff
+
+        next_f_value = []  # double
+        vertex_diff = 0
+
+        for i in range(self.label_size):
+            f_value = 0.0
+
+            for src, weight in zip(in_src, in_weight):
+                f_value += self.vertex_f_map[src][i] * (weight / deg)
+            next_f_value.append(f_value)
+            vertex_diff += abs(f_value - f_values[i])
+
+        return next_f_value, vertex_diff
+
+    def enqueue_neighbours(self, vertex_id, frontier):
+        for dest in self.vertex_adj_map[vertex_id]:
+            if not self.vertex_label_map[dest]:
+                frontier[dest] = None
+
+    def run(
+        self,
+        eps,
+        max_iter,
+        show_log=False,
+        clean_result=False,
+        result_arrays=False,
+        margins=False,
+    ):
+        start_time = time.time()
         diff = 0.0
-        for i in range(max_iter):
-            logger.debug("Iteration " + str(i + 1))
-            diff = self.iterate()
+        start_iteration = 0
+        if self.resume:
+            start_iteration, diff = self.load_checkpoint()
+        if self.warm_start_file is not None and start_iteration == 0:
+            self.load_warm_start()
+        save_checkpoints = self.checkpoint_iterations or self.checkpoint_seconds
+        self._checkpoint_time = start_time
+
+        # a checkpoint saved after the run converged needs no more iterations
+        end_iteration = max_iter
+        if start_iteration > 0 and diff < eps:
+            end_iteration = start_iteration
+
+        if self.solver != "iterate" and end_iteration > start_iteration:
+            self.solve(eps)
+
+        if self.record_metrics:
+            self._best_labels = self.get_best_labels()
+        i = start_iteration - 1
+        for i in range(start_iteration, end_iteration):
+            iteration_start_time = time.time()
+            if self.acceleration is not None:
+                diff = self.iterate_accelerated()
+            else:
+                diff = self.iterate()
+            logger.debug("Iteration " + str(i + 1) + ", diff = " + str(diff))
+            if self.freeze_tol is not None:
+                logger.debug("Number of frozen vertices: " + str(self.frozen_size))
+            if self.record_metrics:
+                self.record_iteration(i + 1, diff, time.time() - iteration_start_time)
             if diff < eps:
                 break
+            if save_checkpoints and self.checkpoint_due(i + 1):
+                self.save_checkpoint(i + 1, diff)
+
+        if save_checkpoints:
+            self.save_checkpoint(i + 1, diff)
+
+        self.iterations = i + 1
+        self.diff = diff
+        self.run_time = time.time() - start_time
 
         if show_log:
             self.show_detail(diff, eps, i, max_iter)
 
+        # a LabelPropResult instead of a row with all the scores of each vertex
+        if result_arrays:
+            return self.get_result(margins)
+
         ans = self.debug()
 
         if clean_result:
@@ -240,9 +876,52 @@ class LabelProp:
         logger.info("Previous numebr of labeled vertices:\t" + str(self.labelled_size))
         logger.info("Value of eps parameter:\t\t" + str(eps))
         logger.info("Value of max_iteration parameter:\t" + str(max_iter))
+        logger.info("Update mode:\t\t\t" + self.update)
+        if self.update == "gauss-seidel":
+            logger.info("Update order:\t\t\t" + self.order)
+        if self.frontier_tol is not None:
+            logger.info("Value of frontier_tol parameter:\t" + str(self.frontier_tol))
+            logger.info("Number of vertex updates:\t\t" + str(self.vertex_updates))
+        if self.sparse_scores:
+            logger.info("Value of top_k parameter:\t\t" + str(self.top_k))
+            logger.info(
+                "Number of stored label scores:\t"
+                + str(sum(len(_) for _ in self.vertex_f_map.values()))
+            )
+        if self.acceleration is not None:
+            logger.info(
+                "Acceleration:\t\t\t"
+                + self.acceleration
+                + " (depth "
+                + str(self.acceleration_depth)
+                + ")"
+            )
+            logger.info("Number of accelerated steps:\t" + str(self.accelerated_steps))
+            logger.info("Number of rejected steps:\t\t" + str(self.rejected_steps))
+        if self.precision != "float64":
+            logger.info("Score precision:\t\t" + self.precision)
+        if self.solver != "iterate":
+            logger.info("Solver:\t\t\t" + self.solver)
+            logger.info("Number of solver iterations:\t" + str(self.solver_iterations))
+        if self.threads > 1:
+            logger.info("Number of threads:\t\t" + str(self.threads))
+        if self.freeze_tol is not None:
+            logger.info(
+                "Value of freeze_tol parameter:\t"
+                + str(self.freeze_tol)
+                + " ("
+                + str(self.freeze_iterations)
+                + " iterations)"
+            )
+            logger.info("Number of frozen vertices:\t\t" + str(self.frozen_size))
+        if self.warm_start_file is not None and not self.resumed_iteration:
+            logger.info("Warm start from:\t\t" + self.warm_start_file)
+        if self.resumed_iteration:
+            logger.info("Resumed from iteration:\t\t" + str(self.resumed_iteration))
         logger.info("Final values:")
         logger.info("iter = " + str(i + 1) + ", diff = " + str(diff))
+        logger.info("Propagation time:\t\t" + str(self.run_time) + " seconds")
 
     def show_vertex_adj(self):
-        for k, v in self.vertex_adj_map.items():
-            logger.debug(str([4, [[_.src, _.dest, _.weight] for _ in v]]))
+        for k, (in_src, in_weight) in self.vertex_in_adj_map.items():
+            logger.debug(str([4, [[_, k, w] for _, w in zip(in_src, in_weight)]]))
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+
+"""
+Multilevel implementation of the label propagation algorithm in sparselabelprop.py
+
+Label propagation needs at least as many iterations as the number of hops from the
+labelled vertices, which is slow on graphs with a large diameter. The graph is
+coarsened repeatedly by matching pairs of neighbouring vertices with the same label,
+or without a label. Label propagation is solved on the coarsest graph, and the
+scores are projected back to each finer graph and refined with a few iterations.
+On the input graph the scores are refined with conjugate gradients, preconditioned
+by a V-cycle over the same levels, so that the number of iterations no longer
+grows with the diameter of the graph.
+"""
+
+import logging
+import time
+
+import numpy as np
+
+from scipy import sparse
+from scipy.sparse import linalg
+
+from graphbin.utils.labelpropagation.sparselabelprop import SparseLabelProp
+
+
+__author__ = "Vijini Mallawaarachchi"
+__copyright__ = "Copyright 2019-2022, GraphBin Project"
+__credits__ = ["Vijini Mallawaarachchi"]
+__license__ = "BSD-3"
+__version__ = "1.6"
+__maintainer__ = "Vijini Mallawaarachchi"
+__email__ = "vijini.mallawaarachchi@anu.edu.au"
+__status__ = "Production"
+
+# create logger
+logger = logging.getLogger("GraphBin %s" % __version__)
+
+
+def get_matching(n_vertices, src, dest, weight, labels, matching_rounds=3, seed=0):
+    # coarse vertex of each vertex, pairing neighbours which choose each other as
+    # their heaviest edge, and the number of coarse vertices. Only unlabelled
+    # vertices or vertices with the same label are paired, so that unlabelled
+    # vertices are never clamped to a label on a coarse level
+    rng = np.random.default_rng(seed)
+    noise = rng.random(n_vertices)
+    vertices = np.arange(n_vertices)
+
+    # ties between edges of the same weight are broken by a noise which is the
+    # same in both directions of an edge
+    key = weight * (1.0 + 0.1 * np.modf(noise[src] + noise[dest])[0])
+    allowed = (src != dest) & (labels[src] == labels[dest])
+
+    matched = np.full(n_vertices, -1, dtype=np.int64)
+    for _ in range(matching_rounds):
+        free = matched < 0
+        edges = np.flatnonzero(allowed & free[src] & free[dest])
+        if len(edges) == 0:
+            break
+
+        # heaviest edge of each vertex, the one to the first vertex if tied
+        edges = edges[np.lexsort((dest[edges], -key[edges], src[edges]))]
+        first = np.ones(len(edges), dtype=bool)
+        first[1:] = src[edges[1:]] != src[edges[:-1]]
+        choice = np.full(n_vertices, -1, dtype=np.int64)
+        choice[src[edges[first]]] = dest[edges[first]]
+
+        chosen = np.flatnonzero(choice >= 0)
+        mutual = chosen[choice[choice[chosen]] == chosen]
+        matched[mutual] = choice[mutual]
+
+    # coarse vertices are numbered in the order of their first vertex
+    first_vertex = np.where(matched >= 0, np.minimum(vertices, matched), vertices)
+    coarse, aggregate = np.unique(first_vertex, return_inverse=True)
+
+    return aggregate, len(coarse)
+
+
+class MultilevelLabelProp(SparseLabelProp):
+
+    # coarsening stops at this number of vertices, after max_levels levels, or
+    # when a level keeps more than min_reduction of the vertices
+    coarsest_size = 1000
+    max_levels = 20
+    min_reduction = 0.9
+    matching_rounds = 3
+    # iterations on the coarsest graph after its conjugate gradient solve, and on
+    # each finer graph after the projection
+    coarsest_iterations = 100
+    refine_iterations = 5
+    # damped jacobi sweeps before and after the coarse correction of a V-cycle
+    smoothing_sweeps = 2
+    smoothing_weight = 2.0 / 3.0
+    # the coarsest level of a V-cycle is factorised up to this number of
+    # unlabelled vertices. Coarsening only stops above it on graphs with a small
+    # diameter, where the coarsest level is smoothed with coarsest_sweeps instead
+    factorise_size = 5000
+    coarsest_sweeps = 10
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # the coarse levels are solved by solve() in run()
+        self.solver = "multilevel"
+
+    ################################################################################
+    #   Prepare Data
+    ################################################################################
+
+    def initialize_env(self):
+        super().initialize_env()
+        self._graph_edges = None  # (array(int), array(int), array(float))
+        self.levels = []  # [(array(int), SparseLabelProp)], see get_levels
+        self.level_stats = []  # [dict], one per level from the input graph
+
+    def setup_env(self):
+        # the input graph is coarsened in solve()
+        self._graph_edges = (self._edge_src, self._edge_dest, self._edge_weight)
+        super().setup_env()
+        self.level_stats = [
+            {
+                "level": 0,
+                "vertices": self.vertex_size,
+                "edges": len(self._graph_edges[0]),
+                "coarsen_time": 0.0,
+                "propagate_time": 0.0,
+                "cycle_time": 0.0,
+            }
+        ]
+
+    ################################################################################
+    #   Label Propagation
+    ################################################################################
+
+    def get_levels(self):
+        # coarser graphs as (aggregate, SparseLabelProp), where aggregate is the
+        # coarse vertex of each vertex of the finer graph
+        src, dest, weight = self._graph_edges
+        labels = self.vertex_labels
+        n_vertices = self.vertex_size
+        levels = []
+
+        while n_vertices > self.coarsest_size and len(levels) < self.max_levels:
+            start_time = time.time()
+            aggregate, n_coarse = get_matching(
+                n_vertices, src, dest, weight, labels, self.matching_rounds
+            )
+            if n_coarse > self.min_reduction * n_vertices:
+                break
+
+            # edges between the same coarse vertices are merged by adding up
+            # their weights, and edges inside a coarse vertex are dropped
+            coarse_labels = np.zeros(n_coarse, dtype=np.int64)
+            coarse_labels[aggregate] = labels
+            adj = sparse.coo_matrix(
+                (weight, (aggregate[src], aggregate[dest])), shape=(n_coarse, n_coarse)
+            ).tocsr()
+            adj.setdiag(0)
+            adj.eliminate_zeros()
+            adj = adj.tocoo()
+            src, dest, weight = adj.row, adj.col, adj.data
+
+            lp = SparseLabelProp()
+            lp.load_data_from_arrays(
+                np.arange(n_coarse), coarse_labels, src, dest, weight
+            )
+            levels.append((aggregate, lp))
+            self.level_stats.append(
+                {
+                    "level": len(levels),
+                    "vertices": n_coarse,
+                    "edges": len(src),
+                    "coarsen_time": time.time() - start_time,
+                    "propagate_time": 0.0,
+                    "cycle_time": 0.0,
+                }
+            )
+            labels = coarse_labels
+            n_vertices = n_coarse
+
+        # the coarsest level is solved with conjugate gradients
+        if len(levels) > 0:
+            levels[-1][1].solver = "cg"
+
+        return levels
+
+    def solve(self, eps):
+        self.levels = self.get_levels()
+        self._graph_edges = None
+
+        # solve the coarsest level, then project the scores of each level to the
+        # unlabelled vertices of the finer level and refine them. Saved scores
+        # are a better start than the coarse levels
+        vertex_f = None
+        start_from_zero = not self.resumed_iteration and self.warm_start_file is None
+        for level in range(len(self.levels) if start_from_zero else 0, 0, -1):
+            start_time = time.time()
+            lp = self.levels[level - 1][1]
+            max_iter = self.coarsest_iterations
+            if vertex_f is not None:
+                lp.set_scores(vertex_f[self.levels[level][0][lp.unlabelled]])
+                max_iter = self.refine_iterations
+            lp.run(eps, max_iter, result_arrays=True)
+            vertex_f = lp.vertex_f
+            self.solver_iterations += lp.iterations + lp.solver_iterations
+            self.level_stats[level]["iterations"] = lp.iterations
+            self.level_stats[level]["solver_iterations"] = lp.solver_iterations
+            self.level_stats[level]["propagate_time"] = time.time() - start_time
+
+        if vertex_f is not None:
+            self.set_scores(vertex_f[self.levels[0][0][self.unlabelled]])
+
+        # refine the input graph with conjugate gradients
+        start_time = time.time()
+        solver_iterations = self.solver_iterations
+        super().solve(eps)
+        self.level_stats[0]["solver_iterations"] = (
+            self.solver_iterations - solver_iterations
+        )
+        self.level_stats[0]["propagate_time"] = time.time() - start_time
+        self.levels = []
+
+        for stats in self.level_stats[1:]:
+            logger.info(
+                "Level "
+                + str(stats["level"])
+                + ": "
+                + str(stats["vertices"])
+                + " vertices, "
+                + str(stats["edges"])
+                + " edges, coarsened in "
+                + "{:.3f}".format(stats["coarsen_time"])
+                + " seconds, "
+                + str(stats.get("iterations", 0))
+                + " iterations and "
+                + str(stats.get("solver_iterations", 0))
+                + " solver iterations in "
+                + "{:.3f}".format(stats["propagate_time"])
+                + " seconds, V-cycles "
+                + "{:.3f}".format(stats["cycle_time"])
+                + " seconds"
+            )
+
+    def get_preconditioner(self, laplacian, rows):
+        # a V-cycle over the levels, for the unlabelled rows solved by solve()
+        cycle_levels = self.get_cycle_levels()
+        n_unlabelled = len(self.unlabelled)
+
+        def apply_cycle(x):
+            rhs = np.zeros(n_unlabelled)
+            rhs[rows] = np.ravel(x)
+            return self.v_cycle(cycle_levels, 0, rhs)[rows]
+
+        return linalg.LinearOperator(
+            laplacian.shape, matvec=apply_cycle, dtype=np.float64
+        )
+
+    def get_cycle_levels(self):
+        # laplacian and inverse degrees of the unlabelled vertices of each level,
+        # and the restriction of their residuals to the unlabelled vertices of the
+        # coarser level. The coarsest level is factorised instead
+        cycle_levels = []
+        lps = [self] + [lp for _, lp in self.levels]
+
+        for level, lp in enumerate(lps):
+            n_unlabelled = len(lp.unlabelled)
+            w_uu = lp.in_weights.astype(np.float64)[:, lp.unlabelled]
+            deg = lp.vertex_deg.astype(np.float64)
+            laplacian = (
+                sparse.diags(deg) @ (sparse.identity(n_unlabelled) - w_uu)
+            ).tocsr()
+            inv_deg = np.divide(1.0, deg, out=np.zeros_like(deg), where=deg > 0)
+
+            if level + 1 < len(lps):
+                coarse = lps[level + 1]
+                coarse_row = np.full(coarse.vertex_size, -1, dtype=np.int64)
+                coarse_row[coarse.unlabelled] = np.arange(len(coarse.unlabelled))
+                restriction = sparse.csr_matrix(
+                    (
+                        np.ones(n_unlabelled),
+                        (
+                            coarse_row[self.levels[level][0][lp.unlabelled]],
+                            np.arange(n_unlabelled),
+                        ),
+                    ),
+                    shape=(len(coarse.unlabelled), n_unlabelled),
+                )
+                cycle_levels.append((laplacian, inv_deg, restriction))
+            elif n_unlabelled <= self.factorise_size:
+                # components without a label are singular, so the factorised
+                # laplacian is shifted slightly
+                shift = 1e-8 * max(deg.mean(), 1.0) if n_unlabelled else 0.0
+                factor = linalg.splu(
+                    (laplacian + shift * sparse.identity(n_unlabelled)).tocsc()
+                )
+                cycle_levels.append((laplacian, inv_deg, factor))
+            else:
+                cycle_levels.append((laplacian, inv_deg, None))
+
+        return cycle_levels
+
+    def v_cycle(self, cycle_levels, level, rhs):
+        # approximate solution of laplacian @ x = rhs on a level
+        start_time = time.time()
+        laplacian, inv_deg, coarse = cycle_levels[level]
+        if level + 1 == len(cycle_levels):
+            if coarse is not None:
+                x = coarse.solve(rhs)
+            else:
+                x = self.smoothing_weight * inv_deg * rhs
+                for _ in range(self.coarsest_sweeps - 1):
+                    x += self.smoothing_weight * inv_deg * (rhs - laplacian @ x)
+            self.level_stats[level]["cycle_time"] += time.time() - start_time
+            return x
+
+        x = self.smoothing_weight * inv_deg * rhs
+        for _ in range(self.smoothing_sweeps - 1):
+            x += self.smoothing_weight * inv_deg * (rhs - laplacian @ x)
+        residual = rhs - laplacian @ x
+        self.level_stats[level]["cycle_time"] += time.time() - start_time
+
+        correction = self.v_cycle(cycle_levels, level + 1, coarse @ residual)
+
+        start_time = time.time()
+        x += coarse.T @ correction
+        for _ in range(self.smoothing_sweeps):
+            x += self.smoothing_weight * inv_deg * (rhs - laplacian @ x)
+        self.level_stats[level]["cycle_time"] += time.time() - start_time
+
+        return x
+
+    def run(self, eps, max_iter, **kwargs):
+        ans = super().run(eps, max_iter, **kwargs)
+
+        # the iterations of run() after solve() finish the input graph
+        stats = self.level_stats[0]
+        logger.info(
+            "Level 0: "
+            + str(stats["vertices"])
+            + " vertices, "
+            + str(stats["edges"])
+            + " edges, "
+            + str(stats.get("solver_iterations", 0))
+            + " solver iterations in "
+            + "{:.3f}".format(stats["propagate_time"])
+            + " seconds, V-cycles "
+            + "{:.3f}".format(stats["cycle_time"])
+            + " seconds, "
+            + str(self.iterations)
+            + " iterations"
+        )
+
+        return ans
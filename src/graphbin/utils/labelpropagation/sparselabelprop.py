@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+
+"""
+Sparse matrix implementation of the label propagation algorithm in labelprop.py
+
+The graph is held as a CSR matrix of row-normalised in-edge weights and the label
+scores as a dense NumPy matrix, so that one iteration is a single sparse matrix
+product with the rows of the labelled vertices clamped.
+"""
+
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+from inspect import signature
+
+import numpy as np
+
+from scipy import sparse
+from scipy.sparse import csgraph, linalg
+
+from graphbin.utils.labelpropagation.labelprop import (
+    LabelProp,
+    LabelPropResult,
+)
+
+
+__author__ = "Vijini Mallawaarachchi"
+__copyright__ = "Copyright 2019-2022, GraphBin Project"
+__credits__ = ["Vijini Mallawaarachchi"]
+__license__ = "BSD-3"
+__version__ = "1.6"
+__maintainer__ = "Vijini Mallawaarachchi"
+__email__ = "vijini.mallawaarachchi@anu.edu.au"
+__status__ = "Production"
+
+# create logger
+logger = logging.getLogger("GraphBin %s" % __version__)
+
+# the relative tolerance of the scipy solvers is called tol before scipy 1.12
+SOLVER_RTOL = "rtol" if "rtol" in signature(linalg.cg).parameters else "tol"
+
+
+class SparseLabelProp(LabelProp):
+
+    # number of vertices updated together by a gauss-seidel sweep in input order
+    block_size = 4096
+    # bytes of scores and temporaries held by each thread for its label columns
+    label_block_memory = 64 * 2**20
+
+    ################################################################################
+    #   Prepare Data
+    ################################################################################
+
+    def initialize_env(self):
+        super().initialize_env()
+        self.vertex_ids = None  # array(int)
+        self.label_index_map = {}  # int, int
+        self.vertex_labels = None  # array(int), 0 if unlabelled
+        self.unlabelled = None  # array(int), indices of unlabelled vertices
+        self.in_weights = None  # csr_matrix, unlabelled vertices x vertices
+        self.vertex_f = None  # array(float), vertices x labels
+        self.vertex_deg = None  # array(float), degree of the unlabelled vertices
+        self.frontier = None  # array(int), rows of in_weights to recompute
+        self.vertex_order = None  # [(array(int), csr_matrix)], blocks in sweep order
+        self._out_adj = None  # csc_matrix, in_weights indexed by source vertex
+        self.active = None  # array(int), rows of in_weights which are not frozen
+        self.settled = None  # array(int), consecutive iterations a row was settled
+        self._active_blocks = None  # [(array(int), csr_matrix)], active rows
+        self._sweep_rows = None  # [array(int)], get_vertex_order()
+
+    def load_data_from_arrays(self, vertex_ids, labels, src, dest, weights=None):
+        self.initialize_env()
+        self.vertex_ids = np.asarray(vertex_ids, dtype=np.int64)
+        self.vertex_labels = np.asarray(labels, dtype=np.int64)
+        self.vertex_size = len(self.vertex_ids)
+
+        # edges are held by the indices of their vertices in vertex_ids
+        sorter = np.argsort(self.vertex_ids, kind="stable")
+        self._edge_src = self.get_vertex_index(src, sorter)
+        self._edge_dest = self.get_vertex_index(dest, sorter)
+        if weights is None:
+            self._edge_weight = np.ones(len(self._edge_src))
+        else:
+            self._edge_weight = np.asarray(weights, dtype=np.float64)
+
+        self.setup_env()
+
+    def get_vertex_index(self, vertex_ids, sorter):
+        vertex_ids = np.asarray(vertex_ids, dtype=np.int64)
+        pos = np.searchsorted(self.vertex_ids, vertex_ids, sorter=sorter)
+        index = sorter[np.minimum(pos, len(sorter) - 1)]
+        if len(vertex_ids) > 0 and (
+            len(sorter) == 0 or (self.vertex_ids[index] != vertex_ids).any()
+        ):
+            raise Exception("Coundn't find the vertices of an edge")
+        return index
+
+    def setup_env(self):
+        n_vertices = self.vertex_size
+        src, dest, weight = self._edge_src, self._edge_dest, self._edge_weight
+        self._edge_src, self._edge_dest, self._edge_weight = [], [], []
+
+        # degree of a vertex is the total weight of its outgoing edges
+        deg = np.bincount(src, weights=weight, minlength=n_vertices)
+
+        # in-edges of each vertex keep the order in which LabelProp visits them,
+        # so that the scores are summed in the same order
+        order = np.argsort(dest, kind="stable")
+        src, dest, weight = src[order], dest[order], weight[order]
+        norm_weight = np.divide(
+            weight, deg[dest], out=np.zeros_like(weight), where=deg[dest] != 0
+        )
+        indptr = np.zeros(n_vertices + 1, dtype=np.int64)
+        np.cumsum(np.bincount(dest, minlength=n_vertices), out=indptr[1:])
+        in_weights = sparse.csr_matrix(
+            (norm_weight.astype(self.precision), src, indptr),
+            shape=(n_vertices, n_vertices),
+        )
+
+        # setup label_index_map
+        l_set = np.unique(self.vertex_labels[self.vertex_labels != 0]).tolist()
+        for label_enum, l in enumerate(l_set):
+            self.label_index_map[l] = label_enum
+        self.label_size = len(l_set)
+
+        # setup vertex_f, labelled vertices start with a score of 1.0 for their label
+        labelled = np.flatnonzero(self.vertex_labels)
+        self.unlabelled = np.flatnonzero(self.vertex_labels == 0)
+        self.labelled_size = len(labelled)
+        self.in_weights = in_weights[self.unlabelled]
+        self.vertex_deg = deg[self.unlabelled]
+
+        self.vertex_f = np.zeros((n_vertices, self.label_size), dtype=self.precision)
+        label_cols = np.searchsorted(l_set, self.vertex_labels[labelled])
+        self.vertex_f[labelled, label_cols] = 1.0
+
+    ################################################################################
+    #   Label Propagation
+    ################################################################################
+
+    def debug(self):
+        labels = sorted(self.label_index_map, key=self.label_index_map.get)
+        labelled = np.flatnonzero(self.vertex_labels)
+        best = self.vertex_f.argmax(axis=1) if self.label_size else None
+        vertex_ids = self.vertex_ids.tolist()
+
+        ans = []
+        # unlabelled vertices are reported first, in the same order as LabelProp
+        for idx in np.concatenate((self.unlabelled, labelled)):
+            im_ans = [vertex_ids[idx], labels[best[idx]]]
+            im_ans.extend(
+                [label, f_val]
+                for label, f_val in zip(labels, self.vertex_f[idx].tolist())
+            )
+            ans.append(im_ans)
+
+        return ans
+
+    def get_result(self, margins=False):
+        labels = np.array(self.get_labels(), dtype=np.int64)
+        order = np.concatenate((self.unlabelled, np.flatnonzero(self.vertex_labels)))
+        best = np.zeros(self.vertex_size, dtype=np.int64)
+        best_scores = np.zeros(self.vertex_size, dtype=np.float64)
+        best_margins = np.zeros(self.vertex_size, dtype=np.float64) if margins else None
+
+        # one block of vertices at a time, to bound the memory of the temporaries
+        for block in range(
+            0, self.vertex_size if self.label_size else 0, self.block_size
+        ):
+            vertex_f = self.vertex_f[block : block + self.block_size]
+            rows = np.arange(len(vertex_f))
+            best[block : block + self.block_size] = vertex_f.argmax(axis=1)
+            best_f = vertex_f[rows, best[block : block + self.block_size]]
+            best_scores[block : block + self.block_size] = best_f
+            if margins and self.label_size > 1:
+                second_f = np.partition(vertex_f, -2, axis=1)[:, -2]
+                best_margins[block : block + self.block_size] = best_f - second_f
+            elif margins:
+                best_margins[block : block + self.block_size] = best_f
+
+        return LabelPropResult(
+            self.vertex_ids[order],
+            labels[best[order]] if self.label_size else best[order],
+            best_scores[order],
+            best_margins[order] if margins else None,
+        )
+
+    def iterate(self):
+        if self.frontier_tol is not None:
+            return self.iterate_frontier()
+        if self.freeze_tol is not None:
+            return self.iterate_active()
+        if self.threads > 1:
+            return self.iterate_label_blocks()
+        if self.update == "gauss-seidel":
+            return self.iterate_in_place()
+
+        next_f = self.in_weights @ self.vertex_f
+        diff = np.abs(next_f - self.vertex_f[self.unlabelled]).sum(dtype=np.float64)
+        self.vertex_f[self.unlabelled] = next_f
+
+        return float(diff)
+
+    def solve(self, eps):
+        # the iteration converges to F_U = W_UU F_U + W_UL F_L, where W is
+        # in_weights. Multiplied by the degrees of the unlabelled vertices this is
+        # the reduced Laplacian system (D_U - A_UU) F_U = A_UL F_L, which is
+        # symmetric positive definite for the components with a labelled vertex
+        n_unlabelled = len(self.unlabelled)
+        in_weights = self.in_weights.astype(np.float64)
+        w_uu = in_weights[:, self.unlabelled]
+        has_label = np.asarray(
+            (in_weights[:, np.flatnonzero(self.vertex_labels)] != 0).sum(axis=1)
+        ).ravel()
+
+        # components without a label are singular and are left to the iteration
+        n_components, component = csgraph.connected_components(w_uu, connection="weak")
+        anchored = np.bincount(component, weights=has_label, minlength=n_components)
+        rows = np.flatnonzero((anchored[component] > 0) & (self.vertex_deg > 0))
+        if len(rows) == 0 or self.label_size == 0:
+            return
+
+        deg = sparse.diags(self.vertex_deg[rows])
+        laplacian = (deg @ (sparse.identity(len(rows)) - w_uu[rows][:, rows])).tocsr()
+        rhs = deg @ (
+            in_weights[rows] @ self.vertex_f
+            - w_uu[rows] @ self.vertex_f[self.unlabelled]
+        )
+
+        # the system is only symmetric if every edge has the same weight in both
+        # directions
+        asymmetry = abs(laplacian - laplacian.T).max() if laplacian.nnz else 0.0
+        solver = linalg.cg if asymmetry <= 1e-10 else linalg.bicgstab
+        preconditioner = self.get_preconditioner(laplacian, rows)
+
+        # one label at a time. The change of the next iteration is the residual
+        # divided by the degrees, so that with this atol diff is below eps
+        atol = (
+            0.5
+            * eps
+            * self.vertex_deg[rows].min()
+            / (self.label_size * np.sqrt(len(rows)))
+        )
+        vertices = self.unlabelled[rows]
+
+        def count_iteration(_):
+            self.solver_iterations += 1
+
+        unconverged = 0
+        for col in range(self.label_size):
+            solution, info = solver(
+                laplacian,
+                rhs[:, col],
+                x0=self.vertex_f[vertices, col].astype(np.float64),
+                atol=atol,
+                maxiter=10 * len(rows),
+                M=preconditioner,
+                callback=count_iteration,
+                **{SOLVER_RTOL: 0.0},
+            )
+            if info != 0:
+                unconverged += 1
+            self.vertex_f[vertices, col] = np.maximum(solution, 0.0)
+
+        if unconverged > 0:
+            logger.warning(
+                "The solver did not converge for "
+                + str(unconverged)
+                + " labels, continuing with the iteration"
+            )
+
+        if self.frontier_tol is not None:
+            self.reset_frontier()
+
+        logger.info(
+            "Solved the scores of "
+            + str(len(rows))
+            + " of "
+            + str(n_unlabelled)
+            + " unlabelled vertices in "
+            + str(self.solver_iterations)
+            + " solver iterations"
+        )
+
+    def get_preconditioner(self, laplacian, rows):
+        # preconditioner of the solver for the laplacian of the unlabelled rows
+        return sparse.diags(1.0 / laplacian.diagonal())
+
+    def iterate_frontier(self):
+        if self.frontier is None:
+            # only vertices next to a labelled vertex can change in the first iteration
+            self.frontier = self.get_out_neighbours(np.flatnonzero(self.vertex_labels))
+
+        vertices = self.unlabelled[self.frontier]
+        if self.update == "gauss-seidel":
+            # vertices of the frontier see the scores already updated in this sweep
+            vertex_diff = np.zeros(len(vertices))
+            for block in range(0, len(vertices), self.block_size):
+                rows = self.frontier[block : block + self.block_size]
+                next_f = self.in_weights[rows] @ self.vertex_f
+                block_vertices = vertices[block : block + self.block_size]
+                vertex_diff[block : block + self.block_size] = np.abs(
+                    next_f - self.vertex_f[block_vertices]
+                ).sum(axis=1, dtype=np.float64)
+                self.vertex_f[block_vertices] = next_f
+        else:
+            next_f = self.in_weights[self.frontier] @ self.vertex_f
+            vertex_diff = np.abs(next_f - self.vertex_f[vertices]).sum(
+                axis=1, dtype=np.float64
+            )
+            self.vertex_f[vertices] = next_f
+
+        # neighbours of a vertex which changed have to be recomputed
+        self.vertex_updates += len(self.frontier)
+        self.frontier = self.get_out_neighbours(
+            vertices[vertex_diff > self.frontier_tol]
+        )
+
+        return float(vertex_diff.sum())
+
+    def iterate_in_place(self):
+        if self.vertex_order is None:
+            self.vertex_order = [
+                (self.unlabelled[rows], self.in_weights[rows])
+                for rows in self.get_vertex_order()
+            ]
+
+        diff = 0.0
+
+        # scores are updated one block of vertices at a time, so that the later
+        # blocks of a sweep already see them
+        for vertices, in_weights in self.vertex_order:
+            next_f = in_weights @ self.vertex_f
+            diff += np.abs(next_f - self.vertex_f[vertices]).sum(dtype=np.float64)
+            self.vertex_f[vertices] = next_f
+
+        return float(diff)
+
+    def iterate_active(self):
+        if self.active is None:
+            self.active = np.arange(len(self.unlabelled))
+            self.settled = np.zeros(len(self.unlabelled), dtype=np.int64)
+        if self._active_blocks is None:
+            self._active_blocks = self.get_active_blocks()
+
+        diff = 0.0
+
+        # a jacobi iteration is a single block of all the active rows
+        for rows, in_weights in self._active_blocks:
+            vertices = self.unlabelled[rows]
+            f_values = self.vertex_f[vertices]
+            next_f = in_weights @ self.vertex_f
+            vertex_diff = np.abs(next_f - f_values).sum(axis=1, dtype=np.float64)
+            diff += vertex_diff.sum()
+            self.vertex_f[vertices] = next_f
+
+            # settled rows have a best label, which is the same as before, and
+            # changed by at most freeze_tol
+            if self.label_size == 0:
+                continue
+            best = next_f.argmax(axis=1)
+            settled = (
+                (best == f_values.argmax(axis=1))
+                & (next_f[np.arange(len(rows)), best] > 0.0)
+                & (vertex_diff <= self.freeze_tol)
+            )
+            self.settled[rows] = np.where(settled, self.settled[rows] + 1, 0)
+
+        frozen = self.settled[self.active] >= self.freeze_iterations
+        if frozen.any():
+            self.active = self.active[~frozen]
+            self.frozen_size = len(self.unlabelled) - len(self.active)
+            self._active_blocks = None
+
+        return float(diff)
+
+    def get_active_blocks(self):
+        if self.update != "gauss-seidel":
+            return [(self.active, self.in_weights[self.active])]
+
+        if self._sweep_rows is None:
+            self._sweep_rows = self.get_vertex_order()
+        is_active = np.zeros(len(self.unlabelled), dtype=bool)
+        is_active[self.active] = True
+
+        blocks = []
+        for rows in self._sweep_rows:
+            rows = rows[is_active[rows]]
+            if len(rows) > 0:
+                blocks.append((rows, self.in_weights[rows]))
+        return blocks
+
+    def iterate_label_blocks(self):
+        # the scores of each label only depend on the same label of the
+        # neighbours, so blocks of label columns are updated concurrently. The
+        # sparse products and array operations release the GIL
+        if self.update == "gauss-seidel" and self.vertex_order is None:
+            self.vertex_order = [
+                (self.unlabelled[rows], self.in_weights[rows])
+                for rows in self.get_vertex_order()
+            ]
+
+        with ThreadPoolExecutor(self.threads) as executor:
+            diffs = list(executor.map(self.update_label_block, self.get_label_blocks()))
+
+        return float(sum(diffs))
+
+    def get_label_blocks(self):
+        # label columns split evenly between the threads, in blocks small enough
+        # for a copy of their scores and the temporaries of an update to fit in
+        # label_block_memory
+        row_bytes = self.vertex_f.itemsize * (
+            self.vertex_size + 3 * len(self.unlabelled)
+        )
+        block_cols = min(
+            -(-self.label_size // self.threads),
+            max(1, self.label_block_memory // max(row_bytes, 1)),
+        )
+        return [
+            slice(col, min(col + block_cols, self.label_size))
+            for col in range(0, self.label_size, block_cols)
+        ]
+
+    def update_label_block(self, cols):
+        block_f = np.ascontiguousarray(self.vertex_f[:, cols])
+
+        if self.update == "gauss-seidel":
+            diff = 0.0
+            for vertices, in_weights in self.vertex_order:
+                next_f = in_weights @ block_f
+                diff += np.abs(next_f - block_f[vertices]).sum(dtype=np.float64)
+                block_f[vertices] = next_f
+            self.vertex_f[:, cols] = block_f
+            return diff
+
+        next_f = self.in_weights @ block_f
+        diff = np.abs(next_f - block_f[self.unlabelled]).sum(dtype=np.float64)
+        self.vertex_f[self.unlabelled, cols] = next_f
+
+        return diff
+
+    def get_unlabelled_ids(self):
+        return self.vertex_ids[self.unlabelled]
+
+    def reset_frontier(self):
+        self.frontier = np.arange(len(self.unlabelled))
+
+    def get_scores(self):
+        return self.vertex_f[self.unlabelled]
+
+    def set_scores(self, scores):
+        self.vertex_f[self.unlabelled] = scores
+
+    def get_settled(self):
+        if self.settled is None:
+            return np.zeros(len(self.unlabelled), dtype=np.int64)
+        return self.settled
+
+    def set_settled(self, settled):
+        self.settled = np.asarray(settled, dtype=np.int64).copy()
+        self.active = np.flatnonzero(self.settled < self.freeze_iterations)
+        self.frozen_size = len(self.unlabelled) - len(self.active)
+        self._active_blocks = None
+
+    def get_vertex_order(self):
+        # blocks of rows of in_weights in sweep order
+        n_unlabelled = len(self.unlabelled)
+        if self.order != "bfs":
+            return [
+                np.arange(block, min(block + self.block_size, n_unlabelled))
+                for block in range(0, n_unlabelled, self.block_size)
+            ]
+
+        # each level of a breadth first search from the labelled vertices
+        visited = np.zeros(n_unlabelled, dtype=bool)
+        vertices = np.flatnonzero(self.vertex_labels)
+        vertex_order = []
+
+        while len(vertices) > 0:
+            rows = self.get_out_neighbours(vertices)
+            rows = rows[~visited[rows]]
+            visited[rows] = True
+            if len(rows) > 0:
+                vertex_order.append(rows)
+            vertices = self.unlabelled[rows]
+
+        # vertices which cannot be reached from a label go last
+        if not visited.all():
+            vertex_order.append(np.flatnonzero(~visited))
+
+        return vertex_order
+
+    def get_out_neighbours(self, vertices):
+        # rows of in_weights (unlabelled vertices) with an in-edge from vertices
+        if self._out_adj is None:
+            self._out_adj = self.in_weights.tocsc()
+        return np.unique(self._out_adj[:, vertices].indices)
+
+    ################################################################################
+    #   Show Info.
+    ################################################################################
+
+    def show_vertex_adj(self):
+        vertex_ids = self.vertex_ids.tolist()
+        for pos, idx in enumerate(self.unlabelled):
+            row = self.in_weights.getrow(pos)
+            vertex_id = vertex_ids[idx]
+            logger.debug(
+                str(
+                    [
+                        vertex_id,
+                        [
+                            [vertex_ids[src], vertex_id, weight]
+                            for src, weight in zip(row.indices, row.data)
+                        ],
+                    ]
+                )
+            )
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+"""benchmark_gfareader.py: Benchmark of read_links against read_records.
+
+Writes two random GFA files, one with long segments and one with short
+segments, and prints the best time of each parser in MB/s. read_records is
+timed with the mapping of the segment names to the same integer arrays as
+read_links returns.
+
+Usage: python tests/benchmark_gfareader.py [--repeats N] [--seed N] [--tmp_dir DIR]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from graphbin.utils.gfareader.gfareader import read_links, read_records
+
+
+__author__ = "Vijini Mallawaarachchi"
+__copyright__ = "Copyright 2019-2022, GraphBin Project"
+__credits__ = ["Vijini Mallawaarachchi"]
+__license__ = "BSD-3"
+__version__ = "1.6"
+__maintainer__ = "Vijini Mallawaarachchi"
+__email__ = "vijini.mallawaarachchi@anu.edu.au"
+__status__ = "Development"
+
+
+# (name, number of segments, length of the segments, number of links)
+GRAPHS = [
+    ("long_segments", 10000, 20000, 30000),
+    ("short_segments", 200000, 100, 600000),
+]
+
+ORIENTATIONS = {"+": 1, "-": -1}
+
+
+def write_gfa(file_path, n_segments, segment_length, n_links, rng):
+    """Writes a GFA file of random segments and links"""
+    sequence = "".join(rng.choice("ACGT") for _ in range(segment_length))
+    with open(file_path, "w") as file:
+        file.write("H\tVN:Z:1.0\n")
+        for i in range(n_segments):
+            file.write(f"S\tedge_{i}\t{sequence}\tLN:i:{segment_length}\n")
+            for _ in range(n_links // n_segments):
+                file.write(
+                    f"L\tedge_{i}\t{rng.choice('+-')}\t"
+                    f"edge_{rng.randrange(n_segments)}\t{rng.choice('+-')}\t55M\n"
+                )
+
+
+def parse_records(file_path):
+    """Maps the S and L records of read_records to integer arrays"""
+    name_index = {}
+    segments = []
+    src, src_orient, dest, dest_orient = [], [], [], []
+    for record in read_records(file_path, ("S", "L")):
+        if record[0] == "S":
+            segments.append(record[1])
+            name_index.setdefault(record[1], len(name_index))
+        else:
+            src.append(name_index.setdefault(record[1], len(name_index)))
+            src_orient.append(ORIENTATIONS.get(record[2], 0))
+            dest.append(name_index.setdefault(record[3], len(name_index)))
+            dest_orient.append(ORIENTATIONS.get(record[4], 0))
+    return (
+        segments,
+        np.array(src, dtype=np.int64),
+        np.array(src_orient, dtype=np.int8),
+        np.array(dest, dtype=np.int64),
+        np.array(dest_orient, dtype=np.int8),
+    )
+
+
+def best_time(function, file_path, repeats):
+    """Returns the best time in seconds of repeated calls"""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(file_path)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per parser")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the graphs")
+    parser.add_argument("--tmp_dir", default=None, help="directory of the GFA files")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory(dir=args.tmp_dir) as tmp_dir:
+        for name, n_segments, segment_length, n_links in GRAPHS:
+            file_path = os.path.join(tmp_dir, f"{name}.gfa")
+            write_gfa(file_path, n_segments, segment_length, n_links, rng)
+            size = os.path.getsize(file_path) / 1e6
+
+            print(
+                f"{name}: {n_segments} segments x {segment_length} bp, "
+                f"{n_links} links, {size:.0f} MB"
+            )
+            for parser_name, function in [
+                ("read_records", parse_records),
+                ("read_links", read_links),
+            ]:
+                seconds = best_time(function, file_path, args.repeats)
+                print(f"  {parser_name}: {seconds:.3f} s, {size / seconds:.0f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
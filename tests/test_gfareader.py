@@ -0,0 +1,60 @@
+import numpy as np
+
+from graphbin.utils.gfareader.gfareader import read_links, read_records
+
+
+__author__ = "Vijini Mallawaarachchi"
+__copyright__ = "Copyright 2019-2022, GraphBin Project"
+__credits__ = ["Vijini Mallawaarachchi"]
+__license__ = "BSD-3"
+__version__ = "1.6"
+__maintainer__ = "Vijini Mallawaarachchi"
+__email__ = "vijini.mallawaarachchi@anu.edu.au"
+__status__ = "Development"
+
+
+GFA = (
+    "H\tVN:Z:1.0\n"
+    "S\tedge_1\tACGTACGT\tLN:i:8\n"
+    "S\tedge_2\tGGCC\n"
+    "L\tedge_1\t+\tedge_2\t-\t0M\n"
+    "SX\tnot_a_segment\n"
+    "L\tedge_2\t-\tedge_1\t+\t0M\n"
+)
+
+
+def test_read_records(tmp_path):
+    """lines of the record types asked for are split into fields in file order"""
+    graph_file = tmp_path / "graph.gfa"
+    graph_file.write_text(GFA)
+    assert list(read_records(graph_file, ("S",))) == [
+        ["S", "edge_1", "ACGTACGT", "LN:i:8"],
+        ["S", "edge_2", "GGCC"],
+    ]
+    assert [_[:5] for _ in read_records(graph_file, ("L", "S"))] == [
+        ["S", "edge_1", "ACGTACGT", "LN:i:8"],
+        ["S", "edge_2", "GGCC"],
+        ["L", "edge_1", "+", "edge_2", "-"],
+        ["L", "edge_2", "-", "edge_1", "+"],
+    ]
+
+
+def test_read_links(tmp_path):
+    """links agree with the records, with segments of S records numbered first"""
+    graph_file = tmp_path / "graph.gfa"
+    graph_file.write_text(
+        "L\tedge_3\t+\tedge_1\t-\t0M\n" + GFA + "L\tedge_2\t+\tedge_4\t+\t0M"
+    )
+    links = read_links(graph_file)
+    assert links.segments == [_[1] for _ in read_records(graph_file, ("S",))]
+    assert links.names == ["edge_1", "edge_2", "edge_3", "edge_4"]
+    orientations = {"+": 1, "-": -1}
+    records = list(read_records(graph_file, ("L",)))
+    assert [links.names[i] for i in links.src] == [_[1] for _ in records]
+    assert [links.names[i] for i in links.dest] == [_[3] for _ in records]
+    assert np.array_equal(links.src_orient, [orientations[_[2]] for _ in records])
+    assert np.array_equal(links.dest_orient, [orientations[_[4]] for _ in records])
+
+    empty_file = tmp_path / "empty.gfa"
+    empty_file.write_text("")
+    assert len(read_links(empty_file).src) == 0
@@ -0,0 +1,689 @@
+import json
+import random
+from inspect import signature
+
+import numpy as np
+import pytest
+from igraph import Graph
+from scipy.sparse import linalg
+
+from graphbin.utils.graphbin_Func import (
+    getAmbiguousVertices,
+    getBinLists,
+    getClosestAmbiguousVertices,
+    getClosestLabelledVertices,
+    getDataComponents,
+    getLabelledComponents,
+    getRemovedLabels,
+    propagateComponents,
+    runLabelPropagation,
+    updateAmbiguousVertices,
+)
+from graphbin.utils.graphbin_Options import PARSER
+from graphbin.utils.labelpropagation.chains import ChainCompression
+from graphbin.utils.labelpropagation.labelprop import LabelProp
+from graphbin.utils.labelpropagation.multilevellabelprop import (
+    MultilevelLabelProp,
+    get_matching,
+)
+from graphbin.utils.labelpropagation.sparselabelprop import (
+    SOLVER_RTOL,
+    SparseLabelProp,
+)
+
+__author__ = "Vijini Mallawaarachchi"
+__copyright__ = "Copyright 2019-2022, GraphBin Project"
+__credits__ = ["Vijini Mallawaarachchi", "Gavin Huttley"]
+__license__ = "BSD-3"
+__version__ = "1.6"
+__maintainer__ = "Vijini Mallawaarachchi"
+__email__ = "vijini.mallawaarachchi@anu.edu.au"
+__status__ = "Development"
+
+
+def make_data(n_vertices, n_labels=4, seed=0):
+    """returns label propagation input rows for a random graph made of chains
+    with some additional random edges"""
+    rng = random.Random(seed)
+    adj = {i: set() for i in range(n_vertices)}
+    for i in range(n_vertices - 1):
+        if rng.random() < 0.85:
+            adj[i].add(i + 1)
+            adj[i + 1].add(i)
+    for _ in range(n_vertices // 2):
+        a, b = rng.sample(range(n_vertices), 2)
+        adj[a].add(b)
+        adj[b].add(a)
+
+    data = []
+    for i in range(n_vertices):
+        label = rng.randrange(n_labels) + 1 if rng.random() < 0.2 else 0
+        data.append([i, label, [[j, 1.0] for j in sorted(adj[i])]])
+    return data
+
+
+def run_engine(engine, data, eps=0.01, max_iter=50):
+    lp = engine()
+    lp.load_data_from_mem(data)
+    return lp.run(eps, max_iter)
+
+
+@pytest.mark.parametrize("engine", [LabelProp, SparseLabelProp])
+@pytest.mark.parametrize(
+    "update,order",
+    [("jacobi", "input"), ("gauss-seidel", "input"), ("gauss-seidel", "bfs")],
+)
+def test_labelprop_chain(engine, update, order):
+    """labels propagate along a chain to the closest labelled vertex"""
+    data = [
+        [0, 1, [[1, 1.0]]],
+        [1, 0, [[0, 1.0], [2, 1.0]]],
+        [2, 0, [[1, 1.0], [3, 1.0]]],
+        [3, 0, [[2, 1.0], [4, 1.0]]],
+        [4, 2, [[3, 1.0]]],
+    ]
+    ans = run_engine(
+        lambda: engine(update=update, order=order), data, eps=1e-6, max_iter=1000
+    )
+    got = {line[0]: line[1] for line in ans}
+    assert got == {0: 1, 1: 1, 2: 1, 3: 2, 4: 2}
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_sparse_engine_matches_labelprop(seed):
+    """sparse engine gives the same scores as LabelProp"""
+    data = make_data(300 + 50 * seed, seed=seed)
+    assert run_engine(SparseLabelProp, data) == run_engine(LabelProp, data)
+
+
+@pytest.mark.parametrize(
+    "engine,kwargs",
+    [
+        (LabelProp, {"frontier_tol": 0.0}),
+        (SparseLabelProp, {"frontier_tol": 0.0}),
+        (LabelProp, {"sparse_scores": True}),
+        (LabelProp, {"sparse_scores": True, "frontier_tol": 0.0}),
+        (LabelProp, {"sparse_scores": True, "top_k": 4}),
+    ],
+)
+def test_options_match_dict_engine(engine, kwargs):
+    """options which do not change the result give the scores of the dict
+    engine"""
+    data = make_data(400, seed=1)
+    got = run_engine(lambda: engine(**kwargs), data)
+    assert sorted(got) == sorted(run_engine(LabelProp, data))
+
+
+def make_graph(data):
+    """returns an igraph Graph and the labels of the rows made by make_data"""
+    edges = [(v, n) for v, _, neighbours in data for n, _ in neighbours if v < n]
+    return Graph(n=len(data), edges=edges), [line[1] for line in data]
+
+
+def test_data_components():
+    """vertices and edges are split into connected components in input order"""
+    vertex_ids = np.array([0, 1, 2, 3, 4])
+    labels = np.array([1, 0, 0, 2, 0])
+    src = np.array([0, 1, 2, 3])
+    dest = np.array([2, 3, 0, 1])
+    got = [
+        (ids.tolist(), component_src.tolist())
+        for ids, _, component_src, _ in getDataComponents(vertex_ids, labels, src, dest)
+    ]
+    assert got == [([0, 2], [0, 2]), ([1, 3], [1, 3]), ([4], [])]
+
+
+def test_bin_lists():
+    """bins list their contigs in the order they were added to them"""
+    contig_bin = np.array([1, -1, 0, 1, 0, -1])
+    contig_rank = np.array([0, 0, 3, 4, 1, 0])
+    assert getBinLists(contig_bin, contig_rank, 3) == [[4, 2], [0, 3], []]
+
+
+def test_labelled_components():
+    """vertices in components with a labelled vertex are marked"""
+    graph = Graph(n=7, edges=[(0, 1), (1, 2), (3, 4), (5, 5)])
+    assert getLabelledComponents(graph, [2, 5]).tolist() == [
+        True,
+        True,
+        True,
+        False,
+        False,
+        True,
+        False,
+    ]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_removed_labels(seed):
+    """labels are removed as by checking the bins of the neighbours of each
+    vertex bin by bin"""
+    rng = random.Random(seed)
+    n_vertices = 80
+    graph = Graph(
+        n=n_vertices,
+        edges=[
+            (rng.randrange(n_vertices), rng.randrange(n_vertices)) for _ in range(90)
+        ],
+    )
+    contig_bin = np.array([rng.randrange(-1, 3) for _ in range(n_vertices)])
+    contig_rank = np.array(rng.sample(range(n_vertices), n_vertices))
+    bins = [
+        sorted(np.flatnonzero(contig_bin == b), key=lambda i: contig_rank[i])
+        for b in range(3)
+    ]
+    expect = []
+    expect_same_label = []
+    for b in range(3):
+        for i in bins[b]:
+            neighbour_bins = [
+                contig_bin[n] for n in graph.neighbors(i) if contig_bin[n] >= 0
+            ]
+            if any(k != b for k in neighbour_bins):
+                if len(bins[b]) - sum(contig_bin[expect] == b) >= 12:
+                    expect.append(i)
+            elif len(neighbour_bins) > 0:
+                expect_same_label.append(i)
+
+    ambiguous, same_label = getAmbiguousVertices(graph, contig_bin)
+    n_removed = np.zeros(3, dtype=np.int64)
+    assert getRemovedLabels(contig_bin, contig_rank, ambiguous, n_removed, 12) == expect
+    assert n_removed.tolist() == [sum(contig_bin[expect] == b) for b in range(3)]
+    assert np.flatnonzero(same_label).tolist() == sorted(expect_same_label)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_update_ambiguous_vertices(seed):
+    """re-evaluating the vertices whose bins changed gives a full rescan"""
+    rng = np.random.default_rng(seed)
+    n_vertices = 200
+    graph = Graph(n=n_vertices, edges=rng.integers(n_vertices, size=(250, 2)).tolist())
+    evaluated_bin = rng.integers(-1, 3, size=n_vertices)
+    evaluated_ambiguous = getAmbiguousVertices(graph, evaluated_bin)[0]
+    contig_bin = evaluated_bin.copy()
+    changed = rng.choice(n_vertices, 20, replace=False)
+    contig_bin[changed] = rng.integers(-1, 3, size=20)
+    ambiguous = updateAmbiguousVertices(
+        graph, contig_bin, evaluated_bin, evaluated_ambiguous, check=True
+    )
+    expect = getAmbiguousVertices(graph, contig_bin)[0]
+    assert ambiguous.tolist() == expect.tolist()
+
+
+@pytest.mark.parametrize("max_hops", [None, 1, 2])
+@pytest.mark.parametrize("seed", range(5))
+def test_closest_ambiguous_vertices(seed, max_hops):
+    """vertices with a closest labelled vertex in another bin are found as by
+    searching from each vertex"""
+    rng = random.Random(seed)
+    n_vertices = 60
+    edges = [(rng.randrange(n_vertices), rng.randrange(n_vertices)) for _ in range(70)]
+    graph = Graph(n=n_vertices, edges=edges)
+    contig_bin = np.full(n_vertices, -1)
+    contig_bin[rng.sample(range(n_vertices), 15)] = [
+        rng.randrange(3) for _ in range(15)
+    ]
+    binned_contigs = np.flatnonzero(contig_bin >= 0).tolist()
+
+    ambiguous, distance, limited = getClosestAmbiguousVertices(
+        graph, contig_bin, binned_contigs, max_hops=max_hops
+    )
+    for node in binned_contigs:
+        closest = getClosestLabelledVertices(
+            graph, node, binned_contigs, max_hops=max_hops
+        )
+        assert ambiguous[node] == any(contig_bin[closest] != contig_bin[node])
+        assert (distance[node] > 0) == (len(closest) > 0)
+        # the stopped searches would have found a labelled vertex further away
+        stopped = len(closest) == 0 and getClosestLabelledVertices(
+            graph, node, binned_contigs
+        )
+        assert (node in limited) == bool(stopped)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_component_propagation(workers):
+    """propagating per component gives the same labels for disjoint graphs"""
+    args = PARSER.parse_args(["--diff_threshold", "1e-8", "--max_iteration", "500"])
+    first = make_data(60, seed=2)
+    second = [
+        [v + 60, label, [[n + 60, w] for n, w in edges]]
+        for v, label, edges in make_data(60, seed=3)
+    ]
+    graph, labels = make_graph(first + second)
+    vertices = list(range(len(labels)))
+    expect = runLabelPropagation(graph, vertices, labels, args)
+    args.lp_workers = workers
+    got = runLabelPropagation(graph, vertices, labels, args)
+    assert got.vertex_ids.tolist() == expect.vertex_ids.tolist()
+    assert got.labels.tolist() == expect.labels.tolist()
+
+
+def test_component_propagation_without_labels():
+    """components without any label keep label 0 and no score"""
+    args = PARSER.parse_args([])
+    batch = [
+        (np.arange(3), np.zeros(3, dtype=np.int64), np.array([0, 1]), np.array([1, 2]))
+    ]
+    ans, stats = propagateComponents(batch, [], args)
+    assert ans.vertex_ids.tolist() == [0, 1, 2]
+    assert ans.labels.tolist() == [0, 0, 0]
+    assert ans.scores.tolist() == [0.0, 0.0, 0.0]
+    assert stats == []
+
+
+@pytest.mark.parametrize("engine", [LabelProp, SparseLabelProp])
+def test_load_data_repeated_rows(engine):
+    """only the first row of a vertex is loaded"""
+    data = make_data(200, seed=24)
+    repeated = data[:50] + [[data[10][0], 3, [[data[20][0], 2.0]]]] + data[50:]
+    assert run_engine(engine, repeated) == run_engine(engine, data)
+
+
+@pytest.mark.parametrize("engine", [LabelProp, SparseLabelProp])
+def test_load_data_from_graph(engine):
+    """loading an igraph Graph gives the same result as the rows of its
+    neighbours"""
+    graph, labels = make_graph(make_data(400, seed=7))
+    vertices = [v for v in range(graph.vcount()) if v % 5 != 3]
+    data = [
+        [v, labels[v], [[n, 1.0] for n in graph.neighbors(v) if n % 5 != 3]]
+        for v in vertices
+    ]
+    lp = engine()
+    lp.load_data_from_graph(graph, [labels[v] for v in vertices], vertices)
+    assert lp.run(0.01, 50) == run_engine(engine, data)
+
+
+def test_sparse_scores_top_k():
+    """top_k keeps the highest scores of each vertex, the lowest label first"""
+    data = make_data(400, n_labels=6, seed=4)
+    lp = LabelProp(sparse_scores=True)
+    lp.load_data_from_mem(data)
+    lp.run(0.01, 1)
+    expect = {
+        v: sorted(scores, key=lambda label: (-scores[label], label))[:1]
+        for v, scores in lp.vertex_f_map.items()
+    }
+
+    lp = LabelProp(sparse_scores=True, top_k=1)
+    lp.load_data_from_mem(data)
+    lp.run(0.01, 1)
+    assert {v: list(scores) for v, scores in lp.vertex_f_map.items()} == expect
+
+
+@pytest.mark.parametrize("engine", [LabelProp, SparseLabelProp])
+@pytest.mark.parametrize(
+    "kwargs", [{"update": "gauss-seidel", "order": "bfs"}, {"acceleration": "anderson"}]
+)
+def test_fewer_iterations(engine, kwargs):
+    """faster converging options reach diff_threshold in fewer iterations"""
+    data = make_data(1000, seed=5)
+    iterations = []
+    for options in [{}, kwargs]:
+        lp = engine(**options)
+        lp.load_data_from_mem(data)
+        lp.run(1e-4, 1000)
+        iterations.append(lp.iterations)
+    assert iterations[1] < iterations[0]
+
+
+@pytest.mark.parametrize("engine", [LabelProp, SparseLabelProp])
+@pytest.mark.parametrize("acceleration", ["anderson", "aitken"])
+def test_acceleration_matches_plain_iteration(engine, acceleration):
+    """accelerated propagation converges to the same labels with non-negative
+    scores"""
+    data = make_data(500, seed=6)
+    expect = {line[0]: line[1] for line in run_engine(engine, data, 1e-10, 5000)}
+    lp = engine(acceleration=acceleration)
+    lp.load_data_from_mem(data)
+    ans = lp.run(1e-10, 5000)
+    assert {line[0]: line[1] for line in ans} == expect
+    assert all(_[1] >= 0.0 for line in ans for _ in line[2:])
+    labelled = {v: label for v, label, _ in data if label}
+    assert all(line[1] == labelled[line[0]] for line in ans if line[0] in labelled)
+
+
+def test_iteration_metrics():
+    """both engines record the same metrics for each iteration"""
+    data = make_data(300, seed=8)
+    metrics = []
+    for engine in [LabelProp, SparseLabelProp]:
+        lp = engine(record_metrics=True)
+        lp.load_data_from_mem(data)
+        lp.run(0.01, 50)
+        assert [_["iteration"] for _ in lp.metrics] == list(range(1, lp.iterations + 1))
+        assert lp.metrics[-1]["diff"] == lp.diff
+        metrics.append(
+            [(_["label_changes"], _["unscored_vertices"]) for _ in lp.metrics]
+        )
+    assert metrics[0] == metrics[1]
+    # every vertex next to a label gets its first score in the first iteration
+    assert metrics[0][0][0] > 0
+    unscored = [_[1] for _ in metrics[0]]
+    assert unscored == sorted(unscored, reverse=True)
+
+
+@pytest.mark.parametrize("lp_metrics", ["csv", "json"])
+def test_write_metrics(tmp_path, lp_metrics):
+    """metrics are written next to graphbin.log"""
+    args = PARSER.parse_args(
+        ["--lp_metrics", lp_metrics, "--output", str(tmp_path) + "/", "--prefix", ""]
+    )
+    graph, labels = make_graph(make_data(100, seed=9))
+    runLabelPropagation(graph, list(range(len(labels))), labels, args)
+    metrics_file = tmp_path / ("graphbin_lp_metrics." + lp_metrics)
+    assert metrics_file.exists()
+    if lp_metrics == "json":
+        assert json.loads(metrics_file.read_text())[0]["iteration"] == 1
+    else:
+        assert metrics_file.read_text().splitlines()[0] == (
+            "iteration,diff,time,label_changes,unscored_vertices"
+        )
+
+
+@pytest.mark.parametrize(
+    "engine",
+    [
+        LabelProp,
+        SparseLabelProp,
+        lambda **kw: LabelProp(sparse_scores=True, **kw),
+        lambda **kw: LabelProp(frontier_tol=0.0, **kw),
+    ],
+)
+def test_resume_from_checkpoint(tmp_path, engine):
+    """a run resumed from a checkpoint gives the same scores as a single run"""
+    data = make_data(300, seed=10)
+    checkpoint_file = str(tmp_path / "graphbin_lp_checkpoint.npz")
+    expect = run_engine(engine, data, eps=1e-6, max_iter=30)
+
+    lp = engine(checkpoint_file=checkpoint_file, checkpoint_iterations=4)
+    lp.load_data_from_mem(data)
+    lp.run(1e-6, 10)
+
+    lp = engine(checkpoint_file=checkpoint_file, resume=True)
+    lp.load_data_from_mem(data)
+    assert lp.run(1e-6, 30) == expect
+    assert lp.resumed_iteration == 10
+    assert lp.iterations == 30
+
+
+@pytest.mark.parametrize("engine", [LabelProp, SparseLabelProp])
+def test_resume_with_frozen_vertices(tmp_path, engine):
+    """a resumed run freezes the same vertices as a single run"""
+    data = make_data(1000, seed=18)
+    checkpoint_file = str(tmp_path / "graphbin_lp_checkpoint.npz")
+    freeze = {"freeze_tol": 1e-3, "freeze_iterations": 3}
+    lp = engine(**freeze)
+    lp.load_data_from_mem(data)
+    expect = lp.run(1e-6, 40)
+    frozen_size = lp.frozen_size
+
+    lp = engine(checkpoint_file=checkpoint_file, checkpoint_iterations=5, **freeze)
+    lp.load_data_from_mem(data)
+    lp.run(1e-6, 20)
+    assert 0 < lp.frozen_size < frozen_size
+
+    lp = engine(checkpoint_file=checkpoint_file, resume=True, **freeze)
+    lp.load_data_from_mem(data)
+    assert lp.run(1e-6, 40) == expect
+    assert lp.resumed_iteration == 20
+    assert lp.frozen_size == frozen_size
+
+
+def test_checkpoint_of_converged_run(tmp_path):
+    """resuming from a converged run does not iterate further"""
+    data = make_data(300, seed=10)
+    checkpoint_file = str(tmp_path / "graphbin_lp_checkpoint.npz")
+    lp = SparseLabelProp(checkpoint_file=checkpoint_file, checkpoint_seconds=60)
+    lp.load_data_from_mem(data)
+    expect = lp.run(0.01, 100)
+    iterations = lp.iterations
+
+    lp = LabelProp(checkpoint_file=checkpoint_file, resume=True)
+    lp.load_data_from_mem(data)
+    assert sorted(lp.run(0.01, 100)) == sorted(expect)
+    assert lp.iterations == iterations
+
+
+def test_checkpoint_must_match_input(tmp_path):
+    """a checkpoint of a different input is not loaded"""
+    checkpoint_file = str(tmp_path / "graphbin_lp_checkpoint.npz")
+    lp = SparseLabelProp(checkpoint_file=checkpoint_file, checkpoint_iterations=1)
+    lp.load_data_from_mem(make_data(300, seed=10))
+    lp.run(0.01, 5)
+
+    lp = SparseLabelProp(checkpoint_file=checkpoint_file, resume=True)
+    lp.load_data_from_mem(make_data(300, seed=11))
+    with pytest.raises(Exception):
+        lp.run(0.01, 5)
+
+
+def test_float32_scores():
+    """float32 scores stay close to the float64 scores"""
+    data = make_data(500, seed=12)
+    scores = {}
+    for precision in ["float64", "float32"]:
+        lp = SparseLabelProp(precision=precision)
+        lp.load_data_from_mem(data)
+        lp.run(1e-6, 1000)
+        assert lp.vertex_f.dtype == np.dtype(precision)
+        assert lp.in_weights.dtype == np.dtype(precision)
+        assert isinstance(lp.diff, float)
+        scores[precision] = lp.vertex_f
+    assert np.allclose(scores["float32"], scores["float64"], atol=1e-5)
+
+
+@pytest.mark.parametrize(
+    "engine", [LabelProp, SparseLabelProp, lambda: LabelProp(sparse_scores=True)]
+)
+def test_result_arrays(engine):
+    """the result arrays hold the best label and score of each row of the dict
+    engine"""
+    data = make_data(300, n_labels=5, seed=13)
+    rows = run_engine(LabelProp, data, max_iter=20)
+    lp = engine()
+    lp.load_data_from_mem(data)
+    result = lp.run(0.01, 20, result_arrays=True, margins=True)
+    assert result.vertex_ids.tolist() == [line[0] for line in rows]
+    assert result.labels.tolist() == [line[1] for line in rows]
+    for line, score, margin in zip(rows, result.scores, result.margins):
+        scores = sorted((_[1] for _ in line[2:]), reverse=True)
+        assert score == pytest.approx(scores[0])
+        assert margin == pytest.approx(scores[0] - scores[1])
+
+
+@pytest.mark.parametrize("engine", [LabelProp, SparseLabelProp])
+def test_warm_start(tmp_path, engine):
+    """a run warm started from the scores of a run with slightly different
+    labels converges to the same labels in fewer iterations"""
+    data = make_data(1000, seed=15)
+    scores_file = str(tmp_path / "graphbin_lp_scores.npz")
+    lp = SparseLabelProp()
+    lp.load_data_from_mem(data)
+    lp.run(1e-8, 5000)
+    lp.save_scores(scores_file, lp.iterations, lp.diff)
+
+    # change a few of the labels
+    rng = random.Random(15)
+    for line in rng.sample(data, 20):
+        line[1] = rng.randrange(5)
+
+    cold = engine()
+    cold.load_data_from_mem(data)
+    expect = cold.run(1e-6, 5000, result_arrays=True)
+
+    warm = engine(warm_start_file=scores_file)
+    warm.load_data_from_mem(data)
+    got = warm.run(1e-6, 5000, result_arrays=True)
+
+    assert got.vertex_ids.tolist() == expect.vertex_ids.tolist()
+    assert got.labels.tolist() == expect.labels.tolist()
+    assert warm.iterations < cold.iterations
+
+
+def test_cg_solver():
+    """the solver gives the scores of a converged iteration, and is called with
+    the tolerance keyword of the installed scipy"""
+    for solver in (linalg.cg, linalg.bicgstab):
+        assert SOLVER_RTOL in signature(solver).parameters
+
+    data = make_data(1000, seed=16)
+    # a component without labels is left to the iteration
+    data += [[1000, 0, [[1001, 1.0]]], [1001, 0, [[1000, 1.0]]]]
+    lp = SparseLabelProp()
+    lp.load_data_from_mem(data)
+    lp.run(1e-10, 10000)
+    expect = lp.vertex_f
+
+    lp = SparseLabelProp(solver="cg")
+    lp.load_data_from_mem(data)
+    lp.run(1e-8, 10000)
+    assert lp.iterations <= 2
+    assert lp.solver_iterations > 0
+    assert np.allclose(lp.vertex_f, expect, atol=1e-8)
+
+
+def test_cg_solver_asymmetric_weights():
+    """the solver handles edges with different weights in each direction"""
+    vertex_ids = np.arange(6)
+    labels = np.array([1, 0, 0, 0, 0, 2])
+    src = np.array([0, 1, 1, 2, 2, 3, 3, 4, 4, 5])
+    dest = np.array([1, 0, 2, 1, 3, 2, 4, 3, 5, 4])
+    weights = np.array([1.0, 2.0, 1.0, 3.0, 1.0, 1.0, 0.5, 1.0, 1.0, 2.0])
+    results = []
+    for solver, eps in [("iterate", 1e-12), ("cg", 1e-8)]:
+        lp = SparseLabelProp(solver=solver)
+        lp.load_data_from_arrays(vertex_ids, labels, src, dest, weights)
+        lp.run(eps, 10000)
+        results.append(lp.vertex_f)
+    assert np.allclose(results[0], results[1], atol=1e-8)
+
+
+@pytest.mark.parametrize("update", ["jacobi", "gauss-seidel"])
+def test_label_block_threads(update):
+    """label blocks updated by several threads give the same scores"""
+    data = make_data(1000, n_labels=7, seed=17)
+    results = []
+    for threads in [1, 3]:
+        lp = SparseLabelProp(update=update, threads=threads)
+        lp.label_block_memory = 1  # one label column per block
+        lp.load_data_from_mem(data)
+        lp.run(1e-6, 10000)
+        results.append((lp.iterations, lp.vertex_f))
+    assert results[0][0] == results[1][0]
+    assert np.array_equal(results[0][1], results[1][1])
+
+
+@pytest.mark.parametrize("update", ["jacobi", "gauss-seidel"])
+def test_freeze_settled_vertices(update):
+    """frozen vertices keep their labels, and both engines freeze the same ones in
+    jacobi iterations"""
+    data = make_data(1000, seed=18)
+    lp = LabelProp(update=update)
+    lp.load_data_from_mem(data)
+    expect = {_[0]: _[1] for _ in lp.run(1e-6, 10000)}
+
+    results = []
+    for engine in [LabelProp, SparseLabelProp]:
+        lp = engine(
+            update=update, freeze_tol=1e-3, freeze_iterations=3, record_metrics=True
+        )
+        lp.load_data_from_mem(data)
+        ans = lp.run(1e-6, 10000)
+        assert lp.frozen_size > 0
+        assert lp.metrics[-1]["frozen_vertices"] == lp.frozen_size
+        results.append((lp.frozen_size, lp.iterations, ans))
+
+    if update == "jacobi":
+        assert results[0] == results[1]
+    for _, _, ans in results:
+        labels = {_[0]: _[1] for _ in ans}
+        assert sum(labels[_] != expect[_] for _ in expect) <= 10
+
+
+def test_chain_compression():
+    """chains of unlabelled degree-2 vertices are collapsed into weighted edges"""
+    # 0 (label 1) - 1 - 2 - 3 - 4 (label 2), 4 - 5 - 6 - 4 and a tip 4 - 7
+    edges = [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 4), (4, 7)]
+    src = np.array([a for a, b in edges] + [b for a, b in edges])
+    dest = np.array([b for a, b in edges] + [a for a, b in edges])
+    labels = np.array([1, 0, 0, 0, 2, 0, 0, 0])
+    chains = ChainCompression(np.arange(8), labels, src, dest)
+
+    assert chains.vertex_ids.tolist() == [0, 4, 7]
+    assert sorted(zip(chains.src.tolist(), chains.dest.tolist())) == [
+        (0, 4),
+        (4, 0),
+        (4, 7),
+        (7, 4),
+    ]
+    assert chains.weights[chains.src == 0].tolist() == [0.25]
+    assert chains.chain_size == 2
+    assert np.allclose(chains.chain_position, [0.25, 0.5, 0.75, 1 / 3, 2 / 3])
+    assert chains.chain_ids.tolist() == [1, 2, 3, 5, 6]
+    assert chains.get_reduction_ratio() == (3 / 8, 4 / 16)
+
+
+@pytest.mark.parametrize("lp_engine", ["dict", "sparse"])
+def test_chain_compression_result(lp_engine):
+    """propagation on the compressed graph converges to the same scores"""
+    args = PARSER.parse_args(
+        ["--diff_threshold", "1e-10", "--max_iteration", "20000"]
+        + ["--lp_engine", lp_engine]
+    )
+    graph, labels = make_graph(make_data(300, seed=20))
+    vertices = list(range(len(labels)))
+    expect = runLabelPropagation(graph, vertices, labels, args)
+    args.compress_chains = True
+    got = runLabelPropagation(graph, vertices, labels, args)
+    assert got.vertex_ids.tolist() == expect.vertex_ids.tolist()
+    assert np.allclose(got.scores, expect.scores, atol=1e-7)
+    tied = np.isclose(got.scores, 0.0)
+    assert got.labels[~tied].tolist() == expect.labels[~tied].tolist()
+
+
+def make_grid(height, width, n_labelled, seed=0):
+    """returns the vertex ids, labels and edges of a grid with a few labels"""
+    ids = np.arange(height * width).reshape(height, width)
+    a = np.concatenate((ids[:, :-1].ravel(), ids[:-1, :].ravel()))
+    b = np.concatenate((ids[:, 1:].ravel(), ids[1:, :].ravel()))
+    rng = np.random.default_rng(seed)
+    labels = np.zeros(height * width, dtype=np.int64)
+    labels[rng.choice(height * width, n_labelled, replace=False)] = rng.integers(
+        1, 4, n_labelled
+    )
+    return ids.ravel(), labels, np.concatenate((a, b)), np.concatenate((b, a))
+
+
+def test_matching():
+    """only neighbours without a label or with the same label are matched"""
+    vertex_ids, labels, src, dest = make_grid(20, 20, 40, seed=21)
+    aggregate, n_coarse = get_matching(
+        len(labels), src, dest, np.ones(len(src)), labels
+    )
+    assert n_coarse < 0.7 * len(labels)
+    assert np.bincount(aggregate).max() == 2
+    edges = set(zip(src.tolist(), dest.tolist()))
+    for coarse in np.flatnonzero(np.bincount(aggregate) == 2):
+        a, b = np.flatnonzero(aggregate == coarse)
+        assert (a, b) in edges
+        assert labels[a] == labels[b]
+
+
+def test_multilevel_engine():
+    """the multilevel engine converges to the scores of the iterations"""
+    vertex_ids, labels, src, dest = make_grid(40, 30, 12, seed=22)
+    lp = SparseLabelProp()
+    lp.load_data_from_arrays(vertex_ids, labels, src, dest)
+    lp.run(1e-10, 100000)
+    expect = lp.vertex_f
+
+    lp = MultilevelLabelProp()
+    lp.coarsest_size = 100
+    lp.load_data_from_arrays(vertex_ids, labels, src, dest)
+    lp.run(1e-8, 100000)
+    assert lp.iterations <= 2
+    assert len(lp.level_stats) > 3
+    assert lp.level_stats[-1]["vertices"] <= 100
+    assert np.allclose(lp.vertex_f, expect, atol=1e-7)